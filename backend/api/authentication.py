@@ -0,0 +1,42 @@
+import hashlib
+
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+AUTH_CACHE = 'auth_tokens'
+
+
+def get_token_cache_key(key):
+    """В ключе кэша - хэш токена, а не сам токен."""
+    return f'token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(keys):
+    """Удаляет пользователей, закэшированных по этим токенам."""
+    caches[AUTH_CACHE].delete_many(
+        [get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кэшем токен -> пользователь (кэш auth_tokens,
+    settings.AUTH_CACHE_*). Повторные запросы с тем же токеном
+    не обращаются к БД. Запись удаляется при выходе (удаление токена),
+    смене пароля и деактивации (сохранение пользователя) - см.
+    api.signals. Сброс доходит до всех процессов только с общим
+    AUTH_CACHE_BACKEND. С кэшем в памяти (по умолчанию) другие
+    процессы принимают отозванный токен ещё до AUTH_CACHE_TIMEOUT
+    (5 с) - это окно отзыва. Так же, до истечения записи, видны
+    изменения пользователей через QuerySet.update(): он не вызывает
+    сигналов.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = caches[AUTH_CACHE]
+        cache_key = get_token_cache_key(key)
+        user = cache.get(cache_key)
+        if user is not None:
+            return user, self.get_model()(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, user)
+        return user, token
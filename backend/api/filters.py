@@ -1,15 +1,46 @@
+from django.db.models import F
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
+from recipes.catalog import get_catalog
 from recipes.models import User, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class IngredientFilter(SearchFilter):
     """
-    Фильтр поиска по частичному вхождению в начале названия ингредиента.
+    Поиск ингредиентов по названию для списка - по индексу в памяти
+    процесса, без запроса к БД: сначала совпадения по началу названия,
+    затем по подстроке и с опечатками.
+    В остальных случаях - частичное вхождение в начале названия.
     """
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param)
+        if not name or getattr(view, 'action', None) != 'list':
+            return super().filter_queryset(request, queryset, view)
+        return get_catalog().ingredient_index.search(name)
+
+
+class RecipeSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск рецептов по названию и описанию
+    с сортировкой по релевантности.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_recipes(queryset, text)
+
+
+def tag_choices():
+    """Слаги тегов из каталога в памяти процесса - без запроса к БД."""
+    return [(tag.slug, tag.name) for tag in get_catalog().sorted_tags]
+
 
 class RecipeFilter(FilterSet):
     """
@@ -20,9 +51,8 @@ class RecipeFilter(FilterSet):
     - тегам
     """
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
-    tags = filters.ModelMultipleChoiceFilter(queryset=Tag.objects.all(),
-                                             field_name='tags__slug',
-                                             to_field_name='slug')
+    tags = filters.MultipleChoiceFilter(choices=tag_choices,
+                                        method='filter_tags')
     is_favorited = filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart')
@@ -31,12 +61,29 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тегов - по маске Recipe.tags_mask,
+        без join на таблицу связей и без дублей. Слаги переводятся в маску
+        по каталогу. Условие на маску индексом не поддерживается: оно
+        проверяется при просмотре строк, отобранных остальными условиями
+        и сортировкой по дате.
+        """
+        if not value:
+            return queryset
+        tags_by_slug = get_catalog().tags_by_slug
+        mask = Tag.get_mask(
+            tags_by_slug[slug] for slug in value if slug in tags_by_slug)
+        return queryset.alias(
+            tags_match=F('tags_mask').bitand(mask)
+        ).filter(tags_match__gt=0)
+
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shopping_cart__author=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
@@ -0,0 +1,95 @@
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from foodgram.metrics import measure
+from recipes.models import Favorite, ShoppingCart
+from recipes.catalog import get_catalog
+from users.models import Subscribe, User
+
+
+def get_viewer_state(user):
+    """
+    Версия избранного, списка покупок и подписок пользователя одним запросом:
+    количество и максимальный id записей каждой таблицы.
+    Любое добавление увеличивает максимальный id, любое удаление без
+    добавления уменьшает количество, поэтому пара меняется при любом
+    изменении.
+    """
+    if not user.is_authenticated:
+        return ()
+    stamps = {}
+    for name, model, field in (('favorite', Favorite, 'user'),
+                               ('cart', ShoppingCart, 'author'),
+                               ('subscribe', Subscribe, 'user')):
+        rows = model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field)
+        stamps[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('pk')).values('value'))
+        stamps[f'{name}_max'] = Subquery(
+            rows.annotate(value=Max('pk')).values('value'))
+    state = User.objects.filter(pk=user.pk).values(**stamps).first() or {}
+    return tuple(state.get(name) for name in sorted(stamps))
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list и retrieve.
+    Наследник возвращает из get_list_validators / get_object_validators
+    части ETag и (при наличии) дату изменения. Если клиент прислал
+    совпадающий If-None-Match или If-Modified-Since, отвечаем 304
+    без сериализации. Версия справочников берётся из каталога процесса
+    (get_catalog), тем же значением, что и данные ответа.
+    """
+
+    def get_list_validators(self, queryset):
+        return (get_catalog().version,), None
+
+    def get_object_validators(self, instance):
+        return (get_catalog().version, instance.pk), None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        parts, last_modified = self.get_list_validators(queryset)
+        return self.conditional_response(
+            parts, last_modified, lambda: self.render_list(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        parts, last_modified = self.get_object_validators(instance)
+        return self.conditional_response(
+            parts, last_modified,
+            lambda: Response(self.serialize(self.get_serializer(instance))))
+
+    def render_list(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(self.serialize(serializer))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(self.serialize(serializer))
+
+    @staticmethod
+    def serialize(serializer):
+        """serializer.data с замером этапа serialize для Server-Timing."""
+        with measure('serialize'):
+            return serializer.data
+
+    def conditional_response(self, parts, last_modified, render):
+        etag = quote_etag(hashlib.md5(
+            ':'.join(map(str, parts)).encode()
+        ).hexdigest())
+        timestamp = last_modified and int(last_modified.timestamp())
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization',))
+        return response
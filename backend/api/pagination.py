@@ -1,8 +1,170 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
 
-from foodgram.constants import PAGE_SIZE
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, PageNumberPagination,
+                                       _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.constants import MAX_BIGINT, PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (cursor).
+    Страница выбирается условием на поля сортировки view.cursor_ordering,
+    без COUNT(*) и OFFSET, поэтому глубина листания не влияет на скорость.
+    Курсор - закодированные значения полей сортировки крайней записи.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = PAGE_SIZE
+    default_ordering = ('-pk',)
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'cursor_ordering', None)
+                              or self.default_ordering)
+        position, reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.reverse_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, ordering))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def reverse_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                     for field in self.ordering)
+
+    def seek(self, position, ordering):
+        """
+        Условие "строго после позиции" для лексикографического порядка:
+        (a >= x) AND ((a > x) OR (a = x AND b > y) ...).
+        Избыточное a >= x позволяет СУБД взять диапазон по индексу,
+        а не объединять отдельные выборки по каждой ветке OR.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        field, value = ordering[0], position[0]
+        lookup = 'lte' if field.startswith('-') else 'gte'
+        return Q(**{f'{field.lstrip("-")}__{lookup}': value}) & condition
+
+    def encode_cursor(self, obj, reverse):
+        position = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps(
+            {'p': [value.isoformat() if hasattr(value, 'isoformat')
+                   else value for value in position],
+             'r': int(reverse)},
+            separators=(',', ':')
+        )
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = payload['p']
+            if len(values) != len(self.ordering) or not all(
+                    map(self.is_valid_value, values)):
+                raise ValueError
+            position = [self.get_field(model, field).to_python(value)
+                        for field, value in zip(self.ordering, values)]
+            return position, bool(payload.get('r'))
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def is_valid_value(value):
+        """
+        Значение позиции - строка или целое в пределах bigint:
+        null, списки и объекты в курсоре не создаются, а в условии
+        seek() дали бы ошибку БД.
+        """
+        if isinstance(value, bool):
+            return False
+        if isinstance(value, int):
+            return -MAX_BIGINT - 1 <= value <= MAX_BIGINT
+        return isinstance(value, str)
+
+    def get_field(self, model, field):
+        name = field.lstrip('-')
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация (page, limit).
+    Если view задаёт cursor_ordering и в запросе передан параметр cursor
+    (в т.ч. пустой - первая страница), используется KeysetPagination.
+    """
     page_size_query_param = "limit"
     page_size = PAGE_SIZE
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (getattr(view, 'cursor_ordering', None)
+                and self.cursor_pagination_class.cursor_query_param
+                in request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request,
+                                                           view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+    stream(title, rows) - генератор частей файла; rows - итератор строк
+    агрегации (name, measurement_unit, amount), поэтому документ
+    не собирается в памяти целиком. render() нужен только для ответов
+    с ошибками: они отдаются в JSON, как и остальные ошибки API,
+    чтобы текст ошибки не терялся в файле любого формата.
+    """
+    charset = 'utf-8'
+    extension = None
+
+    def get_content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def stream(self, title, rows):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = extension = 'txt'
+
+    def stream(self, title, rows):
+        yield f'{title}\n\n'.encode()
+        for name, unit, amount in rows:
+            yield f'{name} - {amount} {unit}\n'.encode()
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = extension = 'csv'
+
+    def stream(self, title, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class JsonShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = extension = 'json'
+
+    def stream(self, title, rows):
+        yield f'{{"title": {json.dumps(title, ensure_ascii=False)}, '.encode()
+        yield b'"ingredients": ['
+        separator = ''
+        for name, unit, amount in rows:
+            item = json.dumps({'name': name, 'measurement_unit': unit,
+                               'amount': amount}, ensure_ascii=False)
+            yield f'{separator}{item}'.encode()
+            separator = ', '
+        yield b']}'
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """
+    PDF собирается постранично в буфер и отдаётся после последней
+    страницы: reportlab пишет таблицу ссылок в конце файла.
+    Для кириллицы нужен TTF-шрифт (settings.SHOPPING_LIST_FONT),
+    без него используется встроенная Helvetica.
+    """
+    media_type = 'application/pdf'
+    format = extension = 'pdf'
+    charset = None
+
+    def get_font(self):
+        if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+            return PDF_FONT
+        try:
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT, settings.SHOPPING_LIST_FONT))
+        except Exception:
+            return 'Helvetica'
+        return PDF_FONT
+
+    def stream(self, title, rows):
+        buffer = io.BytesIO()
+        document = canvas.Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        _, height = A4
+        y = height - PDF_MARGIN
+        document.setFont(font, PDF_FONT_SIZE + 2)
+        document.drawString(PDF_MARGIN, y, title)
+        y -= PDF_FONT_SIZE * 2
+        document.setFont(font, PDF_FONT_SIZE)
+        for name, unit, amount in rows:
+            if y < PDF_MARGIN:
+                document.showPage()
+                document.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            document.drawString(PDF_MARGIN, y, f'{name} - {amount} {unit}')
+            y -= PDF_FONT_SIZE * 1.5
+        document.save()
+        yield buffer.getvalue()
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CsvShoppingListRenderer,
+    JsonShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
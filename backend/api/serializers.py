@@ -1,10 +1,104 @@
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import (Manager, OuterRef, Prefetch, Subquery,
+                              prefetch_related_objects)
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, status
+from rest_framework.settings import api_settings
 
+from foodgram.constants import (MAX_BATCH_SIZE, MAX_BIGINT,
+                                RECIPE_CACHE_TIMEOUT)
+from recipes.cart import cart_users, change_cart_totals
+from recipes.catalog import get_catalog
+from recipes.images import existing_variants
 from recipes.models import (Tag, Ingredient, Recipe, IngredientRecipe,
-                            Favorite, ShoppingCart)
+                            Favorite, ShoppingCart, ShoppingCartTotal)
+from recipes.signals import bulk_changes
 from users.models import User, Subscribe
+from .uploads import read_image_token
+
+RECIPE_PREFETCH = (
+    Prefetch('ingredient_recipe',
+             queryset=IngredientRecipe.objects.only(
+                 'recipe', 'ingredient', 'amount')),
+)
+
+
+def get_context_catalog(context):
+    """Каталог справочников, один на весь запрос."""
+    if 'catalog' not in context:
+        context['catalog'] = get_catalog()
+    return context['catalog']
+
+
+def reload_context_catalog(context):
+    """
+    Промах каталога (запись добавлена, а каталог ещё старый):
+    справочники перечитываются из БД, но не чаще раза за запрос.
+    """
+    if not context.get('catalog_reloaded'):
+        context['catalog'] = get_catalog(reload=True)
+        context['catalog_reloaded'] = True
+    return context['catalog']
+
+
+class CatalogRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Связь со справочником: id проверяется по каталогу в памяти,
+    затем по объектам, заранее загруженным родительским сериалайзером
+    (context['resolved'], см. RecipeCreateSerializer.resolve_ids);
+    в БД идём, только если id нет ни там, ни там.
+    """
+    catalog_attr = None
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        catalog = getattr(get_context_catalog(self.context),
+                          self.catalog_attr)
+        if pk in catalog:
+            return catalog[pk]
+        resolved = self.context.get('resolved', {}).get(self.catalog_attr, {})
+        if pk in resolved:
+            return resolved[pk]
+        return super().to_internal_value(data)
+
+
+class CatalogTagField(CatalogRelatedField):
+    catalog_attr = 'tags'
+
+
+class CatalogIngredientField(CatalogRelatedField):
+    catalog_attr = 'ingredients'
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Ссылки на готовые варианты изображения рецепта (recipes.images):
+    {"card": url, "detail": url, ...}. Пока пул не построил вариант,
+    его в словаре нет - клиент берёт исходное image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, image):
+        if not image:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in existing_variants(image.name).items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request else url
+        return urls
 
 
 class CustomUserSerializer(serializers.ModelSerializer):
@@ -24,6 +118,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return bool(
             self.context.get('request')
             and self.context.get('request').user.is_authenticated
@@ -39,9 +135,11 @@ class RecipeSubscriptionsSerializer(serializers.ModelSerializer):
     Сериалайзер для поля recipes в сериалайзерах SubcriptionsSerializer,
     и SubscribeSerializer
     """
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionsSerializer(CustomUserSerializer):
@@ -57,29 +155,79 @@ class SubscriptionsSerializer(CustomUserSerializer):
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            limit = int(request.GET.get('recipes_limit'))
+        except (TypeError, ValueError):
+            return None
+        return limit if limit >= 0 else None
+
+    @staticmethod
+    def prefetch_recipes(authors, limit):
+        """
+        Последние limit рецептов каждого автора страницы одним запросом:
+        рецепт берётся, если он среди limit последних рецептов своего
+        автора (коррелированный подзапрос по индексу author, pub_date).
+        Результат - в author.latest_recipes.
+        """
+        if not authors:
+            return
+        recipes = Recipe.objects.all()
+        if limit is not None:
+            latest = Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-pub_date', '-id').values('pk')[:limit]
+            recipes = recipes.filter(pk__in=Subquery(latest))
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes.order_by('-pub_date', '-id'),
+            to_attr='latest_recipes'))
+
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        limit = self.context.get('request').GET.get('recipes_limit')
-        if limit:
-            try:
-                recipes = recipes[:int(limit)]
-            except ValueError:
-                pass
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = obj.recipes.all()
+            limit = self.get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                recipes = recipes[:limit]
         return RecipeSubscriptionsSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
+
+
+class UniquePairSerializer(serializers.ModelSerializer):
+    """
+    Создание связи, защищённой UniqueConstraint, одним INSERT без
+    предварительной проверки exists(): повтор, в т.ч. параллельный,
+    приходит от БД как IntegrityError и возвращается как ошибка 400.
+    """
+    unique_error = None
 
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.unique_error,
+                                              code='unique')
 
-class SubscribeSerializer(serializers.ModelSerializer):
+
+class SubscribeSerializer(UniquePairSerializer):
     """
     Сериалайзер для создания/удаления подписки.
     Только POST и DELETE запросы.
+    Автор передаётся в save() и в контексте (author).
     """
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    unique_error = {
+        api_settings.NON_FIELD_ERRORS_KEY: ['Вы уже подписаны на этого автора']
+    }
 
     class Meta:
         model = Subscribe
-        fields = ('user', 'author')
+        fields = ('user',)
 
     def to_representation(self, instance):
         serializer = SubscriptionsSerializer(instance.author,
@@ -87,12 +235,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def validate(self, data):
-        user = data.get('user')
-        author = data.get('author')
-        if Subscribe.objects.filter(user=user, author=author).exists():
-            raise ValidationError('Вы уже подписаны на этого автора',
-                                  code=status.HTTP_400_BAD_REQUEST)
-        if user == author:
+        if data.get('user') == self.context.get('author'):
             raise ValidationError('Нельзя подписаться на себя.',
                                   code=status.HTTP_400_BAD_REQUEST)
         return data
@@ -125,6 +268,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientRecipeSerializer(serializers.ModelSerializer):
     """
     Сериалайзер для получения ингредиентов в сериалайзере RecipeSerializer.
+    Название и единица измерения берутся из каталога справочников.
     """
     id = serializers.PrimaryKeyRelatedField(source='ingredient.id',
                                             queryset=Ingredient.objects.all())
@@ -136,27 +280,140 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         model = IngredientRecipe
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
+    def to_representation(self, instance):
+        ingredient = get_context_catalog(self.context).ingredients.get(
+            instance.ingredient_id)
+        if ingredient is None:
+            ingredient = reload_context_catalog(self.context).ingredients.get(
+                instance.ingredient_id)
+        if ingredient is not None:
+            instance.ingredient = ingredient
+        return super().to_representation(instance)
+
+
+class ShoppingCartTotalSerializer(serializers.ModelSerializer):
+    """
+    Сериалайзер итогов списка покупок (ingredient, amount).
+    Название и единица измерения берутся из каталога справочников.
+    """
+    id = serializers.IntegerField(source='ingredient_id')
+    name = serializers.SerializerMethodField()
+    measurement_unit = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+    def get_ingredient(self, obj):
+        """
+        Ингредиент из каталога; при промахе каталог перечитывается,
+        а если ингредиента нет и там - он читается по связи.
+        """
+        ingredient = get_context_catalog(self.context).ingredients.get(
+            obj.ingredient_id)
+        if ingredient is None:
+            ingredient = reload_context_catalog(self.context).ingredients.get(
+                obj.ingredient_id)
+        return ingredient or obj.ingredient
+
+    def get_name(self, obj):
+        return self.get_ingredient(obj).name
+
+    def get_measurement_unit(self, obj):
+        return self.get_ingredient(obj).measurement_unit
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Список рецептов: кэш читается одним запросом на всю страницу.
+    """
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.render(list(recipes))
+
 
 class RecipeGetSerializer(serializers.ModelSerializer):
     """
     Сериалайзер для получения рецептов.
     Доступ для всех.
+    Общая для всех пользователей часть ответа кэшируется по id рецепта,
+    дате его изменения и версии справочников. Поля is_favorited,
+    is_in_shopping_cart и author.is_subscribed подставляются на каждый
+    запрос (из аннотаций queryset, если они есть).
     """
-    tags = TagSerializer(many=True)
+    tags = serializers.SerializerMethodField()
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientRecipeSerializer(many=True,
                                              source='ingredient_recipe')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.render([instance])[0]
+
+    def render(self, recipes):
+        for recipe in recipes:
+            self.set_viewer_flags(recipe)
+        request = self.context.get('request')
+        if request is None:
+            prefetch_related_objects(recipes, *RECIPE_PREFETCH)
+            return [super(RecipeGetSerializer, self).to_representation(recipe)
+                    for recipe in recipes]
+        version = get_context_catalog(self.context).version
+        keys = {recipe.pk: (f'recipe:{recipe.pk}:'
+                            f'{recipe.updated.timestamp()}:{version}:'
+                            f'{request.get_host()}')
+                for recipe in recipes}
+        cached = cache.get_many(keys.values())
+        missed = [recipe for recipe in recipes
+                  if keys[recipe.pk] not in cached]
+        if missed:
+            prefetch_related_objects(missed, *RECIPE_PREFETCH)
+            rendered = {
+                keys[recipe.pk]:
+                    super(RecipeGetSerializer, self).to_representation(recipe)
+                for recipe in missed
+            }
+            cache.set_many(rendered, RECIPE_CACHE_TIMEOUT)
+            cached.update(rendered)
+        return [self.add_viewer_flags(cached[keys[recipe.pk]], recipe)
+                for recipe in recipes]
+
+    def set_viewer_flags(self, recipe):
+        recipe.is_favorited = self.get_is_favorited(recipe)
+        recipe.is_in_shopping_cart = self.get_is_in_shopping_cart(recipe)
+        if hasattr(recipe, 'is_subscribed'):
+            recipe.author.is_subscribed = recipe.is_subscribed
+        else:
+            recipe.author.is_subscribed = CustomUserSerializer(
+                context=self.context).get_is_subscribed(recipe.author)
+
+    def add_viewer_flags(self, data, recipe):
+        data['is_favorited'] = recipe.is_favorited
+        data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        data['author']['is_subscribed'] = recipe.author.is_subscribed
+        return data
+
+    def get_tags(self, obj):
+        catalog = get_context_catalog(self.context)
+        if obj.tags_mask & ~catalog.tags_mask:
+            catalog = reload_context_catalog(self.context)
+        tags = catalog.tags_for_mask(obj.tags_mask)
+        return TagSerializer(tags, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return bool(
             self.context.get('request')
             and self.context.get('request').user.is_authenticated
@@ -167,6 +424,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return bool(
             self.context.get('request')
             and self.context.get('request').user.is_authenticated
@@ -182,8 +441,8 @@ class IngredientRecipeCreateSerializer(IngredientRecipeSerializer):
     Сериалайзер для отображения ингредиентов в
      сериалайзере RecipeCreateSerializer.
     """
-    id = serializers.PrimaryKeyRelatedField(source='ingredient',
-                                            queryset=Ingredient.objects.all())
+    id = CatalogIngredientField(source='ingredient',
+                                queryset=Ingredient.objects.all())
 
     class Meta:
         model = IngredientRecipe
@@ -196,22 +455,75 @@ class RecipeCreateSerializer(RecipeGetSerializer):
     Доступ:
     - Создание (POST) - только авторизованные пользователи.
     - Редактирование (PATCH) и удаление (DELETE) - только автор рецепта.
-
+    Изображение - строка base64 (image) или токен файла, заранее
+    загруженного через recipes/images/ (image_token).
     """
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
+    tags = CatalogTagField(many=True, queryset=Tag.objects.all())
     ingredients = IngredientRecipeCreateSerializer(many=True)
+    image = Base64ImageField(required=False)
+    image_token = serializers.CharField(write_only=True, required=False)
+    missing_messages = {
+        'tags': 'Теги не найдены: {}.',
+        'ingredients': 'Ингредиенты не найдены: {}.',
+    }
 
     class Meta:
         model = Recipe
-        fields = ('ingredients', 'tags', 'image',
+        fields = ('ingredients', 'tags', 'image', 'image_token',
                   'name', 'text', 'cooking_time')
 
+    def get_submitted_ids(self, data):
+        ingredients = data.get('ingredients')
+        return {
+            'tags': data.get('tags'),
+            'ingredients': [item.get('id') for item in ingredients
+                            if isinstance(item, dict)]
+            if isinstance(ingredients, list) else None,
+        }
+
+    def resolve_ids(self, data):
+        """
+        Id тегов и ингредиентов, которых нет в каталоге, проверяются
+        одним IN-запросом на справочник; все несуществующие id
+        возвращаются одной ошибкой.
+        """
+        catalog = get_context_catalog(self.context)
+        resolved, errors = {}, {}
+        submitted = self.get_submitted_ids(data)
+        for field, model in (('tags', Tag), ('ingredients', Ingredient)):
+            if not isinstance(submitted[field], list):
+                continue
+            missing = set()
+            for pk in submitted[field]:
+                try:
+                    pk = int(pk)
+                except (TypeError, ValueError):
+                    continue
+                if pk not in getattr(catalog, field):
+                    missing.add(pk)
+            if not missing:
+                continue
+            resolved[field] = model.objects.in_bulk(missing)
+            unknown = sorted(missing - resolved[field].keys())
+            if unknown:
+                errors[field] = [self.missing_messages[field].format(
+                    ', '.join(map(str, unknown)))]
+        if errors:
+            raise serializers.ValidationError(errors)
+        self.context['resolved'] = resolved
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            self.resolve_ids(data)
+        return super().to_internal_value(data)
+
     def to_representation(self, instance):
         serializer = RecipeGetSerializer(instance, context=self.context)
         return serializer.data
 
     def create_ingredient_recipe(self, ingredients, recipe):
+        if not ingredients:
+            return
         IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(
                 ingredient=ingredient['ingredient'],
@@ -220,6 +532,7 @@ class RecipeCreateSerializer(RecipeGetSerializer):
              for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients')
@@ -227,15 +540,51 @@ class RecipeCreateSerializer(RecipeGetSerializer):
         recipe = Recipe.objects.create(**validated_data, author=author)
         self.create_ingredient_recipe(ingredients, recipe)
         recipe.tags.set(tags)
+        recipe.tags_mask = Tag.get_mask(tags)
         return recipe
 
+    def update_ingredient_recipe(self, ingredients, recipe):
+        """
+        Приводит строки IngredientRecipe рецепта к списку ingredients:
+        удаляет лишние одним DELETE, меняет количество через bulk_update,
+        добавляет новые через bulk_create. Неизменённые строки
+        не трогаются. Массовые операции не отправляют сигналы (удаление
+        идёт в bulk_changes()), поэтому итоги списков покупок
+        обновляются здесь же одной разницей.
+        """
+        amounts = {item['ingredient'].pk: item['amount']
+                   for item in ingredients}
+        existing = {row.ingredient_id: row
+                    for row in recipe.ingredient_recipe.all()}
+        deleted = [row for pk, row in existing.items() if pk not in amounts]
+        changed = [row for pk, row in existing.items()
+                   if pk in amounts and row.amount != amounts[pk]]
+        deltas = [(row.ingredient_id, -row.amount) for row in deleted]
+        deltas += [(row.ingredient_id, amounts[row.ingredient_id] - row.amount)
+                   for row in changed]
+        if deleted:
+            with bulk_changes():
+                IngredientRecipe.objects.filter(
+                    pk__in=[row.pk for row in deleted]).delete()
+        if changed:
+            for row in changed:
+                row.amount = amounts[row.ingredient_id]
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredient_recipe(
+            [item for item in ingredients
+             if item['ingredient'].pk not in existing], recipe)
+        deltas += [(pk, amount) for pk, amount in amounts.items()
+                   if pk not in existing]
+        if any(amount for _, amount in deltas):
+            change_cart_totals(cart_users(recipe.pk), deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self.create_ingredient_recipe(ingredients, instance)
+        self.update_ingredient_recipe(ingredients, instance)
         instance.tags.set(tags)
+        instance.tags_mask = Tag.get_mask(tags)
         return super().update(instance, validated_data)
 
     def validate(self, data):
@@ -259,6 +608,15 @@ class RecipeCreateSerializer(RecipeGetSerializer):
         if len(unique_tags) != len(tags):
             raise ValidationError({'tags': 'Повторяющиеся теги.'},
                                   code=status.HTTP_400_BAD_REQUEST)
+        image_token = data.pop('image_token', None)
+        if image_token and not data.get('image'):
+            data['image'] = read_image_token(
+                image_token, self.context.get('request').user)
+            if not data['image']:
+                raise serializers.ValidationError(
+                    {'image_token': 'Недействительный токен изображения.'},
+                    code=status.HTTP_400_BAD_REQUEST
+                )
         image = data.get('image')
         if not image:
             raise serializers.ValidationError(
@@ -274,16 +632,35 @@ class FavoriteShopCartRecipeSerializer(serializers.ModelSerializer):
      FavoriteSerializer и ShoppingCartSerializer.
     """
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """
+    Список id рецептов для пакетного добавления/удаления
+    в избранное или список покупок. Повторы отбрасываются.
+    """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_BIGINT),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+    )
 
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
-class FavoriteSerializer(serializers.ModelSerializer):
+
+class FavoriteSerializer(UniquePairSerializer):
     """
     Сериалайзер для добавления/удаления в избранное.
     Только POST и DELETE запросы.
     """
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    unique_error = {'errors': ['Вы уже добавили этот рецепт в избранное.']}
 
     class Meta:
         model = Favorite
@@ -293,20 +670,16 @@ class FavoriteSerializer(serializers.ModelSerializer):
         serializer = FavoriteShopCartRecipeSerializer(instance.recipe)
         return serializer.data
 
-    def validate(self, data):
-        if Favorite.objects.filter(user=data.get('user'),
-                                   recipe=data.get('recipe')).exists():
-            raise ValidationError(
-                {'errors': 'Вы уже добавили этот рецепт в избранное.'},
-                code=status.HTTP_400_BAD_REQUEST)
-        return data
-
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(UniquePairSerializer):
     """
     Сериалайзер для добавления/удаления в список покупок.
     Только POST и DELETE запросы.
     """
+    author = serializers.HiddenField(
+        default=serializers.CurrentUserDefault())
+    unique_error = {
+        'errors': ['Вы уже добавили этот рецепт в список покупок.']}
 
     class Meta:
         model = ShoppingCart
@@ -315,11 +688,3 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         serializer = FavoriteShopCartRecipeSerializer(instance.recipe)
         return serializer.data
-
-    def validate(self, data):
-        if ShoppingCart.objects.filter(author=data.get('author'),
-                                       recipe=data.get('recipe')).exists():
-            raise ValidationError(
-                {'errors': 'Вы уже добавили этот рецепт в список покупок.'},
-                code=status.HTTP_400_BAD_REQUEST)
-        return data
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+from .authentication import forget_tokens
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход (auth/token/logout/) и удаление токена в админке."""
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    """Смена пароля, деактивация и любые другие изменения профиля."""
+    forget_tokens(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
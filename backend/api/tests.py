@@ -0,0 +1,147 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.catalog import get_catalog
+from recipes.models import Ingredient, IngredientRecipe, Tag
+from users.models import User
+
+INGREDIENTS_COUNT = 30
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeWriteQueriesTest(TestCase):
+    """
+    Количество запросов к БД при создании и изменении рецепта
+    не зависит от числа ингредиентов: связи пишутся пачками.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='pass12345!')
+        cls.tags = [Tag.objects.create(name=name, color=color, slug=slug)
+                    for name, color, slug in (
+                        ('Завтрак', '#E26C2D', 'breakfast'),
+                        ('Обед', '#49B64E', 'lunch'))]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number:02}', measurement_unit='г')
+            for number in range(INGREDIENTS_COUNT * 2))
+        cls.ingredients = list(Ingredient.objects.order_by('name'))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        get_catalog(reload=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, ingredients, amount=10):
+        return {
+            'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                            for ingredient in ingredients],
+            'tags': [tag.pk for tag in self.tags],
+            'image': make_image(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def count_queries(self, request):
+        # Свой объект пользователя на каждый запрос, как при авторизации
+        # по токену: иначе is_subscribed остаётся на нём с прошлого ответа.
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        return response, len(queries)
+
+    def create_recipe(self, ingredients):
+        return self.count_queries(lambda: self.client.post(
+            '/api/recipes/', self.recipe_data(ingredients), format='json'))
+
+    def update_recipe(self, count):
+        response, _ = self.create_recipe(self.ingredients[:count])
+        recipe_id = response.json()['id']
+        # Половина ингредиентов остаётся с новым количеством,
+        # половина заменяется новыми.
+        ingredients = self.ingredients[count // 2:count * 3 // 2]
+        response, queries = self.count_queries(lambda: self.client.patch(
+            f'/api/recipes/{recipe_id}/',
+            self.recipe_data(ingredients, amount=20), format='json'))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            sorted(IngredientRecipe.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')),
+            [(ingredient.pk, 20) for ingredient in ingredients])
+        return queries
+
+    def test_create_recipe_queries(self):
+        counts = []
+        for count in (1, INGREDIENTS_COUNT):
+            response, queries = self.create_recipe(self.ingredients[:count])
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(len(response.json()['ingredients']), count)
+            counts.append(queries)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_recipe_queries(self):
+        # Два ингредиента - наименьший рецепт, в котором есть и изменение
+        # количества, и удаление, и добавление связей.
+        self.assertEqual(self.update_recipe(2),
+                         self.update_recipe(INGREDIENTS_COUNT))
+
+
+class KeysetCursorTest(TestCase):
+    """Подделанный курсор даёт 404, а не ошибку сервера."""
+
+    FORGED_POSITIONS = (
+        [None, None],
+        [{'a': 1}, [1]],
+        ['2024-01-01T00:00:00+00:00', 2 ** 63],
+        ['2024-01-01T00:00:00+00:00', True],
+        ['2024-01-01T00:00:00+00:00'],
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия', password='pass12345!')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def encode(position):
+        payload = json.dumps({'p': position, 'r': 0})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def test_forged_cursor(self):
+        for url in ('/api/recipes/', '/api/recipes/feed/',
+                    '/api/users/subscriptions/'):
+            for position in self.FORGED_POSITIONS:
+                with self.subTest(url=url, position=position):
+                    response = self.client.get(
+                        url, {'cursor': self.encode(position)})
+                    self.assertEqual(response.status_code, 404)
@@ -0,0 +1,83 @@
+import os
+
+from django.core import signing
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+from PIL import Image, UnidentifiedImageError
+
+from foodgram.constants import IMAGE_TOKEN_MAX_AGE, MAX_IMAGE_SIZE
+from recipes.models import Recipe
+
+IMAGE_TOKEN_SALT = 'recipes.image-upload'
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемый файл кусками (chunk_size) во временный файл
+    на диске, не держа его в памяти целиком. Как только принято больше
+    max_size байт, загрузка обрывается, а too_large выставляется в True.
+    """
+
+    def __init__(self, request=None, max_size=MAX_IMAGE_SIZE):
+        super().__init__(request)
+        self.max_size = max_size
+        self.received = 0
+        self.too_large = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.too_large = True
+            raise StopUpload()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def content_too_large(request, max_size=MAX_IMAGE_SIZE):
+    """Отказ по Content-Length - до чтения тела запроса."""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return length > max_size + MULTIPART_OVERHEAD
+
+
+def save_uploaded_image(file):
+    """
+    Проверяет, что файл - изображение допустимого формата (Pillow
+    читает только заголовок), и сохраняет его в каталог изображений
+    рецептов. Временный файл хранилище перемещает, а не копирует;
+    имя файла хранилище даёт по хэшу содержимого.
+    Возвращает имя файла или None, если это не изображение.
+    """
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return None
+    if image_format not in IMAGE_FORMATS:
+        return None
+    file.seek(0)
+    field = Recipe._meta.get_field('image')
+    return field.storage.save(
+        os.path.join(field.upload_to, f'image.{IMAGE_FORMATS[image_format]}'),
+        file)
+
+
+def make_image_token(name, user):
+    return signing.dumps({'name': name, 'user': user.pk},
+                         salt=IMAGE_TOKEN_SALT, compress=True)
+
+
+def read_image_token(token, user):
+    """Имя загруженного файла по токену или None (чужой, устаревший)."""
+    try:
+        payload = signing.loads(token, salt=IMAGE_TOKEN_SALT,
+                                max_age=IMAGE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if payload.get('user') != user.pk:
+        return None
+    return payload.get('name')
@@ -1,25 +1,39 @@
-from django.db.models import Sum
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         SAFE_METHODS)
 from rest_framework.response import Response
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPageNumberPagination
+from .filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
+from .mixins import ConditionalGetMixin, get_viewer_state
+from .pagination import CustomPageNumberPagination, KeysetPagination
 from .permissions import IsAuthorOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
+from .uploads import (LimitedUploadHandler, content_too_large,
+                      make_image_token, save_uploaded_image)
 from .serializers import (CustomUserSerializer, SubscriptionsSerializer,
                           SubscribeSerializer, TagSerializer,
                           IngredientSerializer, RecipeGetSerializer,
                           RecipeCreateSerializer,
-                          FavoriteSerializer, ShoppingCartSerializer)
-from recipes.models import (Tag, Ingredient, Recipe, Favorite, ShoppingCart,
-                            IngredientRecipe)
+                          FavoriteSerializer, ShoppingCartSerializer,
+                          ShoppingCartTotalSerializer, RecipeBatchSerializer)
+from foodgram.constants import MAX_IMAGE_SIZE
+from foodgram.metrics import measure
+from recipes.cart import change_cart_recipes
+from recipes.catalog import get_catalog
+from recipes.models import Tag, Ingredient, Recipe, Favorite, ShoppingCart
+from recipes.signals import bulk_changes
+from recipes.versions import get_recipes_version
 from users.models import User, Subscribe
+from users.signals import change_counter, lock_users
 
 
 class CustomUserViewSet(UserViewSet):
@@ -40,6 +54,7 @@ class CustomUserViewSet(UserViewSet):
     """
     queryset = User.objects.all()
     pagination_class = CustomPageNumberPagination
+    cursor_ordering = ('username', 'id')
     serializer_class = CustomUserSerializer
 
     def get_permissions(self):
@@ -58,12 +73,18 @@ class CustomUserViewSet(UserViewSet):
         Все запросы от имени пользователя должны выполняться с заголовком
         "Authorization: Token TOKENVALUE".
         """
-        followed = User.objects.filter(followed__user=self.request.user)
+        followed = User.objects.filter(
+            followed__user=self.request.user
+        ).annotate(is_subscribed=Value(True))
         pages = self.paginate_queryset(followed)
+        SubscriptionsSerializer.prefetch_recipes(
+            pages, SubscriptionsSerializer.get_recipes_limit(request))
         serializer = SubscriptionsSerializer(pages,
                                              many=True,
                                              context={'request': request})
-        return self.get_paginated_response(serializer.data)
+        with measure('serialize'):
+            data = serializer.data
+        return self.get_paginated_response(data)
 
     @action(
         methods=['post', 'delete'],
@@ -78,26 +99,28 @@ class CustomUserViewSet(UserViewSet):
         "Authorization: Token TOKENVALUE".
         """
         user = self.request.user
-        author = get_object_or_404(User, id=self.kwargs.get('id'))
         if request.method == 'POST':
-            serializer = SubscribeSerializer(data={'user': user.id,
-                                                   'author': author.id},
-                                             context={'request': request})
+            author = get_object_or_404(User, id=self.kwargs.get('id'))
+            serializer = SubscribeSerializer(
+                data={}, context={'request': request, 'author': author})
             serializer.is_valid(raise_exception=True)
-            serializer.save(author=author, user=user)
+            with transaction.atomic():
+                serializer.save(author=author)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
-        delete_cnt, _ = Subscribe.objects.filter(user=user,
-                                                 author=author).delete()
+        with transaction.atomic():
+            delete_cnt, _ = Subscribe.objects.filter(
+                user=user, author_id=self.kwargs.get('id')).delete()
         if not delete_cnt:
+            get_object_or_404(User, id=self.kwargs.get('id'))
             return Response({'errors': 'Нет подписки на этого автора'},
                             status=status.HTTP_400_BAD_REQUEST)
         return Response('Успешная отписка',
                         status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для:
     - Получения списка тегов.
@@ -111,7 +134,8 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny, )
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для:
     - Получения списка ингредиентов.
@@ -127,11 +151,13 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Вьюсет для:
-    - Получения списка рецептов.
+    - Получения списка рецептов (в т.ч. полнотекстовый поиск ?search=).
     - Получения отдельного рецепта.
+    - Ленты рецептов авторов из подписок (recipes/feed/).
+    - Пакетного добавления/удаления рецептов в избранное и список покупок.
     - Создания рецепта.
     - Редактирования рецепта.
     - Удаления рецепта.
@@ -141,25 +167,129 @@ class RecipeViewSet(viewsets.ModelViewSet):
       - Создание рецепта - аутентифицированный пользователь.
       - Редактирование и удаление рецепта - только автор.
     """
-    queryset = Recipe.objects.select_related('author')
     permission_classes = (IsAuthorOrReadOnly, )
     pagination_class = CustomPageNumberPagination
-    filter_backends = (DjangoFilterBackend, )
+    cursor_ordering = ('-pub_date', '-id')
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Рецепты с автором.
+        Флаги текущего пользователя (is_favorited, is_in_shopping_cart,
+        is_subscribed на автора) вычисляются в том же запросе через Exists.
+        Теги и ингредиенты сериалайзер подгружает только для рецептов,
+        которых нет в кэше.
+        """
+        user = self.request.user
+        queryset = Recipe.objects.select_related('author')
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    author=user, recipe=OuterRef('pk'))),
+                is_subscribed=Exists(Subscribe.objects.filter(
+                    user=user, author=OuterRef('author'))),
+            )
+            if self.action == 'feed':
+                queryset = queryset.filter(author__in=Subscribe.objects.filter(
+                    user=user).values('author'))
+        return queryset
+
+    def get_list_validators(self, queryset):
+        """
+        Версии справочников (из каталога) и рецептов, адрес
+        с параметрами и состояние пользователя: без агрегатов по
+        отфильтрованной выборке рецептов.
+        """
+        return (get_catalog().version, get_recipes_version(),
+                self.request.get_full_path(),
+                *get_viewer_state(self.request.user)), None
+
+    def get_object_validators(self, instance):
+        parts = (get_catalog().version, instance.pk, instance.updated)
+        if self.request.user.is_authenticated:
+            return (*parts, instance.is_favorited,
+                    instance.is_in_shopping_cart, instance.is_subscribed), None
+        return parts, instance.updated
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
         return RecipeCreateSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='images',
+        permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser])
+    def upload_image(self, request):
+        """
+        Загрузка изображения рецепта файлом (multipart/form-data, поле
+        image) вместо base64 в JSON. Файл пишется на диск кусками,
+        размер ограничен MAX_IMAGE_SIZE. В ответе - image_token для
+        поля image_token при создании/редактировании рецепта.
+        Доступ:
+        Доступно только авторизованному пользователю.
+        """
+        too_large = Response(
+            {'image': f'Файл больше {MAX_IMAGE_SIZE // 1024 // 1024} МБ.'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if content_too_large(request):
+            return too_large
+        handler = LimitedUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        file = request.FILES.get('image')
+        if handler.too_large:
+            return too_large
+        if file is None:
+            return Response({'image': 'Добавьте изображение.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        name = save_uploaded_image(file)
+        if name is None:
+            return Response({'image': 'Файл не является изображением.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'image_token': make_image_token(name, request.user),
+                         'image': request.build_absolute_uri(
+                             default_storage.url(name))},
+                        status=status.HTTP_201_CREATED)
+
     @action(
         methods=['get'],
         detail=False,
-        permission_classes=[IsAuthenticated])
+        permission_classes=[IsAuthenticated],
+        pagination_class=KeysetPagination)
+    def feed(self, request):
+        """
+        Лента: рецепты всех авторов, на которых подписан пользователь,
+        от новых к старым. Пагинация только по ключу (cursor, limit),
+        фильтры - как у списка рецептов.
+        Страница - один запрос с author_id IN (подписки) по индексам
+        (author, -pub_date, -id) и (-pub_date, -id). Условный GET
+        не используется: его валидатор агрегирует все рецепты ленты
+        и стоит дороже самой страницы.
+        Доступ:
+        Доступно только авторизованному пользователю.
+        """
+        return self.render_list(self.filter_queryset(self.get_queryset()))
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
         """
         Скачать список покупок для выбранных рецептов.
-        Файл в формате txt.
+        Формат файла - ?format=txt|csv|json|pdf (по умолчанию txt).
+        Итоги по ингредиентам хранятся в ShoppingCartTotal, строки
+        читаются курсором и сразу отдаются клиенту.
         Доступ:
         Доступно только авторизованному пользователю.
         Авторизация по токену.
@@ -168,23 +298,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.shopping_cart.exists():
-            ingredients_sum = IngredientRecipe.objects.filter(
-                recipe__shopping_cart__author=user
-            ).values(
-                'ingredient__name', 'ingredient__measurement_unit'
-            ).annotate(amounts=Sum('amount')).order_by('ingredient__name')
-
-            text = f'Список покупок ({user.first_name} {user.last_name})\n\n'
-            for ingredient in ingredients_sum:
-                text += (f'{ingredient["ingredient__name"]} - '
-                         f'{ingredient["amounts"]} '
-                         f'{ingredient["ingredient__measurement_unit"]}\n')
+            ingredients_sum = user.shopping_cart_totals.values_list(
+                'ingredient__name', 'ingredient__measurement_unit', 'amount'
+            ).order_by('ingredient__name')
 
-            file_name = f'Shopping_cart_{user.first_name}_{user.last_name}.txt'
-            response = HttpResponse(content_type='text/plain')
+            renderer = request.accepted_renderer
+            title = f'Список покупок ({user.first_name} {user.last_name})'
+            response = StreamingHttpResponse(
+                renderer.stream(title, ingredients_sum.iterator()),
+                content_type=renderer.get_content_type()
+            )
+            file_name = (f'Shopping_cart_{user.first_name}_{user.last_name}.'
+                         f'{renderer.extension}')
             response['Content-Disposition'] = (
                 f'attachment; filename="{file_name}"')
-            response.write(text)
             return response
         return Response('Список покупок пуст.',
                         status=status.HTTP_404_NOT_FOUND)
@@ -205,22 +332,88 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if request.method == 'POST':
-            serializer = FavoriteSerializer(data={'user': user.id,
-                                                  'recipe': kwargs.get('pk')},
+            serializer = FavoriteSerializer(data={'recipe': kwargs.get('pk')},
                                             context={'request': request})
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with lock_users([user.pk]):
+                serializer.save()
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
-        recipe = get_object_or_404(Recipe, id=kwargs.get('pk'))
-        delete_cnt, _ = Favorite.objects.filter(user=user,
-                                                recipe=recipe).delete()
+        with lock_users([user.pk]):
+            delete_cnt, _ = Favorite.objects.filter(
+                user=user, recipe_id=kwargs.get('pk')).delete()
         if not delete_cnt:
+            get_object_or_404(Recipe, id=kwargs.get('pk'))
             return Response({'errors': 'Этот рецепт не в избранном'},
                             status=status.HTTP_400_BAD_REQUEST)
         return Response('Рецепт удалён из избранного',
                         status=status.HTTP_204_NO_CONTENT)
 
+    def change_batch(self, request, model, user_field, apply_changes):
+        """
+        Пакетное добавление (POST) или удаление (DELETE) рецептов
+        в избранное / список покупок.
+        Рецепты и текущие связи проверяются одним запросом под
+        блокировкой строки пользователя (её берут и одиночные добавление
+        и удаление), изменения - один bulk_create(ignore_conflicts=True)
+        или один DELETE ... IN. Счётчики и итоги по изменённым связям
+        обновляет apply_changes(recipe_ids, sign), сигналы отдельных
+        связей не используются.
+        Ответ - статус по каждому id: added/exists, removed/absent
+        или not_found.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        user = request.user
+        adding = request.method == 'POST'
+        with lock_users([user.pk]):
+            linked = dict(Recipe.objects.filter(pk__in=ids).annotate(
+                linked=Exists(model.objects.filter(
+                    **{user_field: user}, recipe=OuterRef('pk')))
+            ).values_list('pk', 'linked'))
+            changed = [pk for pk, is_linked in linked.items()
+                       if is_linked != adding]
+            if changed and adding:
+                model.objects.bulk_create(
+                    [model(**{user_field: user}, recipe_id=pk)
+                     for pk in changed],
+                    ignore_conflicts=True
+                )
+            elif changed:
+                with bulk_changes():
+                    model.objects.filter(**{user_field: user},
+                                         recipe__in=changed).delete()
+            if changed:
+                apply_changes(changed, 1 if adding else -1)
+        statuses = ('added', 'exists') if adding else ('removed', 'absent')
+        changed = set(changed)
+        return Response([
+            {'id': pk,
+             'status': ('not_found' if pk not in linked
+                        else statuses[pk not in changed])}
+            for pk in ids
+        ])
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        """
+        Добавление/удаление списка рецептов в избранное:
+        {"recipes": [id, ...]}.
+        Доступ:
+        Доступно только авторизованному пользователю.
+        """
+        return self.change_batch(
+            request, Favorite, 'user',
+            lambda recipes, sign: change_counter(
+                Recipe.objects.filter(pk__in=recipes), 'favorites_count',
+                sign))
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -238,19 +431,56 @@ class RecipeViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if request.method == 'POST':
             serializer = ShoppingCartSerializer(
-                data={'author': user.id,
-                      'recipe': kwargs.get('pk')},
+                data={'recipe': kwargs.get('pk')},
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with lock_users([user.pk]):
+                serializer.save()
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        delete_cnt, _ = ShoppingCart.objects.filter(author=user,
-                                                    recipe=recipe).delete()
+        with lock_users([user.pk]):
+            delete_cnt, _ = ShoppingCart.objects.filter(
+                author=user, recipe_id=kwargs.get('pk')).delete()
         if not delete_cnt:
+            get_object_or_404(Recipe, id=kwargs.get('pk'))
             return Response({'errors': 'Этот рецепт не в списке покупок'},
                             status=status.HTTP_400_BAD_REQUEST)
         return Response('Рецепт удалён из списка покупок',
                         status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        """
+        Добавление/удаление списка рецептов в список покупок:
+        {"recipes": [id, ...]}.
+        Доступ:
+        Доступно только авторизованному пользователю.
+        """
+        return self.change_batch(
+            request, ShoppingCart, 'author',
+            lambda recipes, sign: change_cart_recipes(
+                request.user.pk, recipes, sign))
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        """
+        Итоги списка покупок: ингредиенты и их суммарное количество.
+        Читаются из ShoppingCartTotal без пересчёта по рецептам.
+        Доступ:
+        Доступно только авторизованному пользователю.
+        """
+        totals = request.user.shopping_cart_totals.order_by(
+            'ingredient__name')
+        serializer = ShoppingCartTotalSerializer(
+            totals, many=True, context={'request': request})
+        with measure('serialize'):
+            return Response(serializer.data)
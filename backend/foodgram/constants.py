@@ -5,3 +5,9 @@ USERNAME_LEN = FIRST_NAME_LEN = LAST_NAME_LEN = PASS_LEN = 150
 MIN_COOK_TIME = MIN_AMOUNT = 1
 MAX_COOK_TIME = MAX_AMOUNT = 32000
 PAGE_SIZE = 6
+MAX_BATCH_SIZE = 100
+MAX_BIGINT = 2 ** 63 - 1
+MAX_TAGS = 63
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+IMAGE_TOKEN_MAX_AGE = 60 * 60 * 24
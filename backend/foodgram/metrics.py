@@ -0,0 +1,214 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+# Границы корзин гистограмм, секунды.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGES = ('total', 'view', 'db', 'serialize')
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Замеры одного запроса: длительность этапов и число SQL-запросов."""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(STAGES, 0.0)
+        self.queries = 0
+        self.measuring = set()
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper: время и число запросов."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self):
+        durations = self.durations
+        return ', '.join((
+            f'db;dur={durations["db"] * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            f'serialize;dur={durations["serialize"] * 1000:.1f}',
+            f'view;dur={durations["view"] * 1000:.1f}',
+            f'total;dur={durations["total"] * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def measure(stage):
+    """
+    Замер этапа текущего запроса (например, сериализации). SQL-запросы
+    внутри этапа учитываются в db и из этапа вычитаются. Вложенные
+    замеры одного этапа не суммируются. Вне запроса ничего не делает.
+    """
+    timings = _current.get()
+    if timings is None or stage in timings.measuring:
+        yield
+        return
+    timings.measuring.add(stage)
+    db_before = timings.durations['db']
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.measuring.discard(stage)
+        timings.durations[stage] += (time.perf_counter() - started
+                                     - timings.durations['db'] + db_before)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: счётчики корзин, сумма, число."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Гистограммы по маршрутам (имя URL: recipes-list,
+    users-subscriptions, ...) и этапам. Метрики хранятся в памяти
+    процесса: у каждого воркера gunicorn свои.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.queries = {}
+
+    def observe(self, route, method, timings):
+        with self.lock:
+            for stage, value in timings.durations.items():
+                key = (route, method, stage)
+                if key not in self.durations:
+                    self.durations[key] = Histogram()
+                self.durations[key].observe(value)
+            key = (route, method)
+            self.queries[key] = self.queries.get(key, 0) + timings.queries
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP foodgram_request_stage_seconds Время этапов '
+                'обработки запроса.',
+                '# TYPE foodgram_request_stage_seconds histogram',
+            ]
+            for (route, method, stage), histogram in sorted(
+                    self.durations.items()):
+                labels = (f'route="{route}",method="{method}",'
+                          f'stage="{stage}"')
+                total = 0
+                for bound, count in zip(BUCKETS + ('+Inf',),
+                                        histogram.buckets):
+                    total += count
+                    lines.append(f'foodgram_request_stage_seconds_bucket'
+                                 f'{{{labels},le="{bound}"}} {total}')
+                lines.append(f'foodgram_request_stage_seconds_sum'
+                             f'{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'foodgram_request_stage_seconds_count'
+                             f'{{{labels}}} {histogram.count}')
+            lines += [
+                '# HELP foodgram_db_queries_total Число SQL-запросов.',
+                '# TYPE foodgram_db_queries_total counter',
+            ]
+            for (route, method), count in sorted(self.queries.items()):
+                lines.append(f'foodgram_db_queries_total'
+                             f'{{route="{route}",method="{method}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match and match.url_name or 'unmatched'
+
+
+class ServerTimingMiddleware:
+    """
+    Замеры каждого запроса: время SQL и число запросов, сериализации,
+    представления и общее. Отдаются заголовком Server-Timing и
+    накапливаются в гистограммах registry. Стоимость - пара вызовов
+    perf_counter на SQL-запрос и одна блокировка на запрос.
+    Потоковые ответы дописывают замеры по окончании передачи,
+    заголовок для них отражает время до первого байта.
+    Отключается настройкой PERFORMANCE_METRICS = False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with self.wrap_connections(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(timings, started, request)
+        response['Server-Timing'] = timings.server_timing()
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, timings, started, request)
+        else:
+            self.observe(request, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_started = time.perf_counter()
+
+    @staticmethod
+    def wrap_connections(timings):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings.execute))
+        return stack
+
+    @staticmethod
+    def finish(timings, started, request):
+        now = time.perf_counter()
+        timings.durations['total'] = now - started
+        view_started = getattr(request, '_view_started', None)
+        if view_started is not None:
+            timings.durations['view'] = now - view_started
+
+    def stream(self, content, timings, started, request):
+        _current.set(timings)
+        try:
+            with self.wrap_connections(timings):
+                yield from content
+        finally:
+            _current.set(None)
+            self.finish(timings, started, request)
+            self.observe(request, timings)
+
+    @staticmethod
+    def observe(request, timings):
+        registry.observe(get_route(request), request.method, timings)
+
+
+def metrics_view(request):
+    """Гистограммы в текстовом формате Prometheus."""
+    return HttpResponse(registry.render(), content_type=METRICS_CONTENT_TYPE)
@@ -0,0 +1,17 @@
+class MaintainedFieldsMixin:
+    """
+    Модель с полями, которые поддерживаются сигналами и триггерами БД
+    (счётчики, маски, поисковый вектор). Значения этих полей в памяти
+    могут быть устаревшими, поэтому save() существующего объекта
+    их не перезаписывает.
+    """
+    maintained_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.maintained_fields
+            ]
+        super().save(*args, **kwargs)
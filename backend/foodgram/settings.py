@@ -2,6 +2,7 @@ import os
 
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 load_dotenv()
@@ -32,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.ServerTimingMiddleware',
+    'foodgram.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +84,38 @@ TEST_DATABASE = {
 
 DATABASES = TEST_DATABASE if os.getenv('TEST_DATABASE', default=False) == 'True' else PROD_DATABASE
 
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+# Кэш токенов авторизации. В памяти процесса (по умолчанию) выход
+# и смена пароля сбрасывают запись только в одном процессе, поэтому
+# запись живёт несколько секунд. С общим кэшем (например,
+# django.core.cache.backends.memcached.PyMemcacheCache) адрес
+# AUTH_CACHE_LOCATION обязателен, а запись живёт дольше.
+AUTH_CACHE_BACKEND = os.getenv('AUTH_CACHE_BACKEND', LOCMEM_CACHE)
+AUTH_CACHE_SHARED = AUTH_CACHE_BACKEND != LOCMEM_CACHE
+AUTH_CACHE_LOCATION = os.getenv(
+    'AUTH_CACHE_LOCATION', '' if AUTH_CACHE_SHARED else 'foodgram-auth')
+if AUTH_CACHE_SHARED and not AUTH_CACHE_LOCATION:
+    raise ImproperlyConfigured(
+        'AUTH_CACHE_LOCATION обязателен для AUTH_CACHE_BACKEND '
+        f'{AUTH_CACHE_BACKEND}.')
+AUTH_CACHE_TIMEOUT = int(os.getenv(
+    'AUTH_CACHE_TIMEOUT', default=60 * 5 if AUTH_CACHE_SHARED else 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', LOCMEM_CACHE),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    },
+    'auth_tokens': {
+        'BACKEND': AUTH_CACHE_BACKEND,
+        'LOCATION': AUTH_CACHE_LOCATION,
+        'KEY_PREFIX': 'auth',
+        'TIMEOUT': AUTH_CACHE_TIMEOUT,
+        'OPTIONS': {} if AUTH_CACHE_SHARED else {'MAX_ENTRIES': 10000},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -111,6 +146,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static/static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Как часто (в секундах) процесс сверяет свой каталог справочников
+# с версией в БД. Изменения из этого же процесса видны сразу.
+CATALOG_CHECK_INTERVAL = float(
+    os.getenv('CATALOG_CHECK_INTERVAL', default=2))
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -118,10 +159,37 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
+PERFORMANCE_METRICS = os.getenv(
+    'PERFORMANCE_METRICS', default='True') == 'True'
+
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', default='False') == 'True'
+SLOW_QUERY_THRESHOLD_MS = float(
+    os.getenv('SLOW_QUERY_THRESHOLD_MS', default=100))
+SLOW_QUERY_ANALYZE_RATE = float(
+    os.getenv('SLOW_QUERY_ANALYZE_RATE', default=0))
+SLOW_QUERY_ROUTES = [
+    route.strip()
+    for route in os.getenv('SLOW_QUERY_ROUTES', default='').split(',')
+    if route.strip()
+]
+SLOW_QUERY_LOG_FILE = os.getenv(
+    'SLOW_QUERY_LOG_FILE',
+    default=os.path.join(BASE_DIR, 'logs', 'slow_queries.log')
+)
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from rest_framework.fields import Field
+
+from foodgram import metrics
+
+logger = logging.getLogger('foodgram.slow_queries')
+
+EXPLAIN = {
+    'postgresql': ('EXPLAIN', 'EXPLAIN ANALYZE'),
+    'sqlite': ('EXPLAIN QUERY PLAN', None),
+}
+
+_request = ContextVar('slow_query_request', default=None)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_RE = re.compile(r'%s|\?')
+LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPACE_RE = re.compile(r'\s+')
+# Файлы обёрток запросов: место вызова ищется за их пределами.
+WRAPPER_FILES = (__file__, metrics.__file__)
+
+
+def normalize_sql(sql):
+    """
+    SQL без значений: литералы и параметры заменяются на ?, списки
+    IN (?, ?, ...) сворачиваются. Запросы, отличающиеся только
+    значениями, получают одинаковый текст и отпечаток.
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_RE.sub('?', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode()).hexdigest()[:12]
+
+
+def find_caller():
+    """
+    Поле сериалайзера, при выводе которого выполнен запрос, и первая
+    строка кода проекта в стеке. Стек разбирается только для медленных
+    запросов.
+    """
+    field = location = None
+    frame = sys._getframe(2)
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None and (field is None or location is None):
+        code = frame.f_code
+        if location is None and code.co_filename.startswith(base_dir) \
+                and code.co_filename not in WRAPPER_FILES:
+            location = (f'{os.path.relpath(code.co_filename, base_dir)}:'
+                        f'{frame.f_lineno} {code.co_name}')
+        instance = frame.f_locals.get('self')
+        if field is None and isinstance(instance, Field) \
+                and instance.field_name:
+            owner = instance.parent or instance
+            field = f'{type(owner).__name__}.{instance.field_name}'
+        frame = frame.f_back
+    return field, location
+
+
+def explain(connection, sql, params, analyze):
+    """План запроса; ANALYZE выполняет запрос повторно."""
+    commands = EXPLAIN.get(connection.vendor)
+    if commands is None:
+        return None, False
+    command = commands[1] if analyze and commands[1] else commands[0]
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{command} {sql}', params)
+                rows = cursor.fetchall()
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}', False
+    plan = '\n'.join(' '.join(map(str, row)) for row in rows)
+    return plan, command == commands[1]
+
+
+class SlowQueryLogger:
+    """
+    Обёртка connection.execute_wrapper: запросы дольше порога
+    записываются в журнал вместе с планом выполнения.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if (duration >= settings.SLOW_QUERY_THRESHOLD_MS
+                and not self.explaining and not many):
+            self.log(sql, params, duration)
+        return result
+
+    def log(self, sql, params, duration):
+        request = _request.get()
+        route = request and metrics.get_route(request)
+        if settings.SLOW_QUERY_ROUTES and route not in (
+                settings.SLOW_QUERY_ROUTES):
+            return
+        field, location = find_caller()
+        normalized = normalize_sql(sql)
+        plan, analyzed = None, False
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            analyze = random.random() < settings.SLOW_QUERY_ANALYZE_RATE
+            self.explaining = True
+            try:
+                plan, analyzed = explain(self.connection, sql, params,
+                                         analyze)
+            finally:
+                self.explaining = False
+        logger.info(json.dumps({
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(duration, 2),
+            'route': route,
+            'method': request and request.method,
+            'field': field,
+            'location': location,
+            'fingerprint': fingerprint(normalized),
+            'sql': normalized,
+            'analyzed': analyzed,
+            'plan': plan,
+        }, ensure_ascii=False))
+
+
+def get_log_handler():
+    os.makedirs(os.path.dirname(settings.SLOW_QUERY_LOG_FILE), exist_ok=True)
+    handler = RotatingFileHandler(
+        settings.SLOW_QUERY_LOG_FILE, encoding='utf-8', delay=True,
+        maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+        backupCount=settings.SLOW_QUERY_LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+class SlowQueryMiddleware:
+    """
+    Журнал медленных запросов к БД (включается SLOW_QUERY_LOG = True).
+    Запрос дольше SLOW_QUERY_THRESHOLD_MS записывается одной строкой
+    JSON в SLOW_QUERY_LOG_FILE (с ротацией): нормализованный SQL,
+    маршрут, поле сериалайзера, место в коде и EXPLAIN. Для доли
+    SLOW_QUERY_ANALYZE_RATE запросов - EXPLAIN ANALYZE (PostgreSQL).
+    SLOW_QUERY_ROUTES ограничивает журнал перечисленными маршрутами.
+    Сводка - команда slow_queries_report.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if not logger.handlers:
+            logger.addHandler(get_log_handler())
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+    def __call__(self, request):
+        token = _request.set(request)
+        try:
+            with self.wrap_connections():
+                response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request)
+        return response
+
+    @staticmethod
+    def wrap_connections():
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(SlowQueryLogger(connection)))
+        return stack
+
+    def stream(self, content, request):
+        """Запросы потокового ответа выполняются при его передаче."""
+        _request.set(request)
+        try:
+            with self.wrap_connections():
+                yield from content
+        finally:
+            _request.set(None)
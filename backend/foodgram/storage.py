@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    Хранилище, называющее файлы по SHA-256 содержимого:
+    recipes_img/<hash>.<ext>. Одинаковые загрузки попадают в один
+    файл и повторно не пишутся, а файл под своим именем никогда
+    не меняется - его можно кэшировать как immutable.
+    Файлы не удаляются вместе с записями: один файл может
+    принадлежать нескольким рецептам.
+    """
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, f'{digest.hexdigest()}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+content_hash_storage = ContentHashStorage()
@@ -1,7 +1,26 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from foodgram.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
+
+# Метрики доступны только напрямую у backend: nginx проксирует
+# лишь /api/ и /admin/.
+if settings.PERFORMANCE_METRICS:
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
+
+# В production /media/ отдаёт nginx с теми же заголовками.
+urlpatterns += static(
+    settings.MEDIA_URL,
+    view=cache_control(public=True, immutable=True,
+                       max_age=settings.MEDIA_CACHE_MAX_AGE)(serve),
+    document_root=settings.MEDIA_ROOT,
+)
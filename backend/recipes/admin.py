@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import (Tag, Ingredient, Recipe, IngredientRecipe,
-                     Favorite, ShoppingCart)
+                     Favorite, ShoppingCart, ShoppingCartTotal)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -42,7 +42,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientRecipeInline]
 
     def in_favorite(self, obj):
-        return obj.favorite.all().count()
+        return obj.favorites_count
 
     in_favorite.short_description = 'В избранном у других пользователей'
 
@@ -73,9 +73,24 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('author',)
 
 
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    """
+    Админ-зона итогов списков покупок (только просмотр).
+    """
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingCartTotal, ShoppingCartTotalAdmin)
@@ -0,0 +1,80 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingCartTotal
+from users.signals import lock_users
+
+
+def recipe_amounts(recipe_id):
+    return IngredientRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+
+
+def cart_users(recipe_id):
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('author_id', flat=True))
+
+
+def change_cart_recipes(user_id, recipe_ids, sign=1):
+    """Итоги списка покупок после добавления/удаления пачки рецептов."""
+    change_cart_totals([user_id], IngredientRecipe.objects.filter(
+        recipe__in=recipe_ids).values_list('ingredient_id', 'amount'), sign)
+
+
+def change_cart_totals(users, amounts, sign=1):
+    """
+    Прибавляет к итогам списков покупок users количества ингредиентов
+    amounts - пары (ingredient_id, amount); sign=-1 - вычитает.
+    Строки пользователей блокируются (если вызывающий код ещё не сделал
+    этого), чтобы параллельные изменения одного списка не вставили одну
+    и ту же пару дважды.
+    Итоги, ставшие нулевыми, удаляются.
+    """
+    deltas = Counter()
+    for ingredient, amount in amounts:
+        deltas[ingredient] += sign * amount
+    deltas = {key: value for key, value in deltas.items() if value}
+    users = sorted(set(users))
+    if not users or not deltas:
+        return
+    with lock_users(users):
+        totals = ShoppingCartTotal.objects.filter(
+            user__in=users, ingredient__in=deltas)
+        existing = set(totals.values_list('user_id', 'ingredient_id'))
+        if existing:
+            totals.update(amount=Greatest(F('amount') + Case(
+                *(When(ingredient=ingredient, then=Value(delta))
+                  for ingredient, delta in deltas.items()),
+                output_field=IntegerField()
+            ), 0))
+        ShoppingCartTotal.objects.bulk_create(
+            ShoppingCartTotal(user_id=user, ingredient_id=ingredient,
+                              amount=delta)
+            for user in users for ingredient, delta in deltas.items()
+            if delta > 0 and (user, ingredient) not in existing
+        )
+        if min(deltas.values()) < 0:
+            totals.filter(amount=0).delete()
+
+
+def rebuild_cart_totals(users=None):
+    """Пересчитывает итоги списков покупок по исходным таблицам."""
+    carts = ShoppingCart.objects.all()
+    totals = ShoppingCartTotal.objects.all()
+    if users is not None:
+        carts = carts.filter(author__in=users)
+        totals = totals.filter(user__in=users)
+    rows = carts.values_list(
+        'author', 'recipe__ingredient_recipe__ingredient'
+    ).annotate(total=Sum('recipe__ingredient_recipe__amount')).filter(
+        total__isnull=False).order_by()
+    with transaction.atomic():
+        totals.delete()
+        ShoppingCartTotal.objects.bulk_create(
+            ShoppingCartTotal(user_id=user, ingredient_id=ingredient,
+                              amount=total)
+            for user, ingredient, total in rows.iterator()
+        )
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .ingredient_index import IngredientIndex
+from .models import Ingredient, Tag
+from .versions import CATALOG_VERSION, get_catalog_version, local_bumps
+
+
+class Catalog:
+    """
+    Справочники тегов и ингредиентов в памяти процесса.
+    Снимок неизменяем: при изменении справочников строится новый.
+    """
+
+    def __init__(self, version, tags, ingredients):
+        self.version = version
+        self.tags = {tag.pk: tag for tag in tags}
+        self.tags_by_slug = {tag.slug: tag for tag in tags}
+        self.sorted_tags = sorted(tags, key=lambda tag: (tag.name, tag.pk))
+        self.tags_mask = Tag.get_mask(tags)
+        self.ingredients = {
+            ingredient.pk: ingredient for ingredient in ingredients}
+        self.ingredient_index = IngredientIndex(ingredients)
+
+    def tags_for_mask(self, mask):
+        """Теги рецепта по Recipe.tags_mask, в порядке Tag.Meta.ordering."""
+        return [tag for tag in self.sorted_tags if mask & tag.mask]
+
+
+_catalog = None
+_checked = (0.0, 0)
+_lock = threading.Lock()
+
+
+def get_catalog(reload=False):
+    """
+    Каталог загружается при первом обращении и перезагружается, когда
+    меняется версия справочников (сигналы Tag/Ingredient, db_import_data)
+    или при reload=True - если в каталоге не нашлось нужной записи.
+    Версия в БД читается не чаще раза в CATALOG_CHECK_INTERVAL секунд
+    и сразу после изменения справочников в этом процессе; в остальное
+    время каталог отдаётся без обращения к БД.
+    """
+    global _catalog, _checked
+    checked_at, bumps = _checked
+    if (not reload and _catalog is not None
+            and bumps == local_bumps[CATALOG_VERSION]
+            and time.monotonic() - checked_at
+            < settings.CATALOG_CHECK_INTERVAL):
+        return _catalog
+    with _lock:
+        _checked = (time.monotonic(), local_bumps[CATALOG_VERSION])
+        version = get_catalog_version()
+        if reload or _catalog is None or _catalog.version != version:
+            _catalog = Catalog(version, list(Tag.objects.all()),
+                               list(Ingredient.objects.all()))
+    return _catalog
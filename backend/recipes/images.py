@@ -0,0 +1,202 @@
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import Image, features
+
+from .models import Recipe
+from .versions import bump_recipes_version
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+JPEG_QUALITY = WEBP_QUALITY = 82
+IMAGE_VARIANTS = {
+    'card': ((480, 480), 'JPEG'),
+    'detail': ((1200, 1200), 'JPEG'),
+    'card_webp': ((480, 480), 'WEBP'),
+    'detail_webp': ((1200, 1200), 'WEBP'),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def get_variants():
+    """Варианты, которые умеет сохранять установленный Pillow."""
+    webp = features.check('webp')
+    return {name: options for name, options in IMAGE_VARIANTS.items()
+            if webp or options[1] != 'WEBP'}
+
+
+def variant_quality(image_format):
+    return JPEG_QUALITY if image_format == 'JPEG' else WEBP_QUALITY
+
+
+def variant_signature(variant):
+    """
+    Отпечаток параметров варианта (размер, формат, качество). Он входит
+    в имя файла: при изменении параметров меняется и адрес, поэтому
+    файлы вариантов, как и оригиналы, можно кэшировать как immutable.
+    """
+    (width, height), image_format = IMAGE_VARIANTS[variant]
+    params = f'{width}x{height}:{image_format}:{variant_quality(image_format)}'
+    return hashlib.sha256(params.encode()).hexdigest()[:8]
+
+
+def variant_name(name, variant):
+    """recipes_img/abc.png -> recipes_img/variants/abc.card.<отпечаток>.jpg"""
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    extension = EXTENSIONS[IMAGE_VARIANTS[variant][1]]
+    return os.path.join(
+        directory, VARIANTS_DIR,
+        f'{stem}.{variant}.{variant_signature(variant)}.{extension}')
+
+
+def existing_variants(name):
+    return {variant: variant_name(name, variant)
+            for variant in get_variants()
+            if default_storage.exists(variant_name(name, variant))}
+
+
+def make_variants(name, force=False):
+    """
+    Декодирует изображение один раз и сохраняет все его варианты.
+    Выполняется в процессе пула, поэтому работает только с хранилищем
+    файлов, без БД. Возвращает имена созданных файлов.
+    """
+    variants = {variant: variant_name(name, variant)
+                for variant in get_variants()}
+    if not force:
+        variants = {variant: path for variant, path in variants.items()
+                    if not default_storage.exists(path)}
+    if not variants:
+        return []
+    with default_storage.open(name) as file:
+        source = Image.open(file)
+        source.load()
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info
+                                or source.mode in ('LA', 'PA') else 'RGB')
+    created = []
+    for variant, path in variants.items():
+        size, image_format = IMAGE_VARIANTS[variant]
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, optimize=True,
+                   quality=variant_quality(image_format))
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        created.append(default_storage.save(
+            path, ContentFile(buffer.getvalue())))
+    return created
+
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Пул процессов для обработки изображений, создаётся при первом
+    обращении. Процессы запускаются через spawn и настраивают Django
+    сами: fork из многопоточного процесса с открытыми соединениями
+    с БД небезопасен.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                )
+    return _executor
+
+
+def reset_executor(broken):
+    """
+    Сломанный пул (процесс завершился аварийно) больше не принимает
+    задачи: он заменяется новым при следующем get_executor().
+    """
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def variants_ready(name):
+    """
+    Варианты готовы: обновляем дату изменения рецептов с этим
+    изображением, чтобы кэш ответов и ETag учли новые ссылки.
+    """
+    Recipe.objects.filter(image=name).update(updated=timezone.now())
+    bump_recipes_version()
+
+
+def schedule_variants(name, force=False):
+    """
+    Ставит построение вариантов в очередь пула и возвращает Future.
+    При IMAGE_WORKERS = 0 варианты строятся сразу в текущем процессе.
+    Вызывается после фиксации транзакции, поэтому ошибки не
+    пробрасываются, а пишутся в журнал: рецепт уже сохранён,
+    а варианты можно построить позже (make_image_variants).
+    """
+    try:
+        if not settings.IMAGE_WORKERS:
+            if make_variants(name, force):
+                variants_ready(name)
+            return None
+        executor = get_executor()
+        try:
+            future = executor.submit(make_variants, name, force)
+        except BrokenProcessPool:
+            reset_executor(executor)
+            future = get_executor().submit(make_variants, name, force)
+    except Exception:
+        logger.exception('Не удалось построить варианты изображения %s',
+                         name)
+        return None
+    future.add_done_callback(lambda done: on_variants_done(name, done))
+    return future
+
+
+def on_variants_done(name, future):
+    """
+    Обычно выполняется в служебном потоке пула: открытое здесь
+    соединение с БД закрывается сразу, чтобы не держать его между
+    задачами. Соединение потока запроса (если future уже завершён
+    к моменту add_done_callback) не трогаем.
+    """
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Не удалось построить варианты изображения %s',
+                     name, exc_info=error)
+        return
+    if not future.result():
+        return
+    opened = connection.connection is None
+    try:
+        variants_ready(name)
+    finally:
+        if opened:
+            connection.close()
@@ -0,0 +1,134 @@
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+
+NGRAM = 3
+FUZZY_THRESHOLD = 10
+SEARCH_CACHE_SIZE = 1024
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def max_edits(query):
+    """Допустимое число опечаток зависит от длины запроса."""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+def prefix_distance(query, word, limit):
+    """
+    Наименьшее расстояние Дамерау-Левенштейна (с перестановкой соседних
+    букв) между query и началом word. Расчёт обрывается, как только
+    расстояние превышает limit.
+    """
+    a, b = query, word[:len(query) + limit]
+    if len(b) < len(a) - limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous = previous, current
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + cost)
+            if (before and i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current)
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса.
+    Ключи - нормализованные названия, отсортированные для поиска по
+    префиксу бинарным поиском; индекс триграмм - для поиска подстрок;
+    слова названий, сгруппированные по первой букве, - для поиска
+    с опечатками.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda item: (normalize(item.name), item.pk))
+        self.keys = [normalize(item.name) for item in self.ingredients]
+        self.grams = defaultdict(set)
+        words = defaultdict(set)
+        for position, key in enumerate(self.keys):
+            for gram in ngrams(key):
+                self.grams[gram].add(position)
+            for word in key.split():
+                words[word].add(position)
+        self.words = defaultdict(list)
+        for word, positions in words.items():
+            self.words[word[0]].append((word, positions))
+        self.find = lru_cache(SEARCH_CACHE_SIZE)(self.find)
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    def search(self, query):
+        """
+        Сначала совпадения по началу названия (в алфавитном порядке),
+        затем по подстроке. Если точных совпадений мало - ещё названия,
+        в которых начало одного из слов отличается от запроса на пару
+        опечаток (первая буква слова должна совпасть с первой или второй
+        буквой запроса).
+        """
+        return [self.ingredients[position]
+                for position in self.find(normalize(query))]
+
+    def find(self, query):
+        if not query:
+            return tuple(range(len(self.keys)))
+        found = self.prefix(query)
+        seen = set(found)
+        substring = [position for position in self.substring(query)
+                     if position not in seen]
+        found += substring
+        if len(found) < FUZZY_THRESHOLD:
+            seen.update(substring)
+            found += [position for position in self.fuzzy(query)
+                      if position not in seen]
+        return tuple(found)
+
+    def prefix(self, query):
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        return list(range(start, end))
+
+    def substring(self, query):
+        grams = ngrams(query)
+        if grams:
+            candidates = set.intersection(
+                *(self.grams.get(gram, set()) for gram in grams))
+        else:
+            candidates = range(len(self.keys))
+        return sorted(position for position in candidates
+                      if query in self.keys[position])
+
+    def fuzzy(self, query):
+        limit = max_edits(query)
+        if not limit:
+            return []
+        distances = {}
+        for initial in set(query[:2]):
+            for word, positions in self.words.get(initial, ()):
+                distance = prefix_distance(query, word, limit)
+                if distance > limit:
+                    continue
+                for position in positions:
+                    distances[position] = min(
+                        distance, distances.get(position, distance))
+        return sorted(distances, key=lambda position: (
+            distances[position], position))
@@ -0,0 +1,141 @@
+import random
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet
+from recipes.management.commands.generate_dataset import (EPOCH,
+                                                          PUBLISH_PERIOD,
+                                                          explicit_dates)
+from recipes.models import Recipe
+from users.models import Subscribe, User
+
+FEED_URL = '/api/recipes/feed/'
+PREFIX = 'benchmark_'
+
+
+class Command(BaseCommand):
+    """
+    Замер ленты подписок (recipes/feed/) при росте числа подписок:
+    время первой страницы и страницы --page при --follows подписках.
+    Авторы и рецепты создаются в транзакции, которая в конце
+    откатывается, поэтому база не меняется. Запросы проходят через
+    view и сериалайзеры без HTTP-сервера; время - среднее по
+    --requests запросам. Ожидается, что время не растёт с числом
+    подписок.
+    """
+
+    help = "Замер ленты подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=2000)
+        parser.add_argument(
+            '--recipes', type=int, default=25,
+            help='Рецептов у каждого автора')
+        parser.add_argument(
+            '--follows', default='10,100,1000,2000',
+            help='Числа подписок через запятую')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--page', type=int, default=7,
+            help='Номер дальней страницы (переход по cursor)')
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            follows = [int(count) for count in options['follows'].split(',')]
+        except ValueError:
+            raise CommandError('--follows: числа через запятую.')
+        if min(options['authors'], options['recipes'], options['limit'],
+               options['page'], options['requests'], *follows) < 1:
+            raise CommandError('Все параметры должны быть больше нуля.')
+        if max(follows) > options['authors']:
+            raise CommandError('--follows не может превышать --authors.')
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f'Пользователи с префиксом {PREFIX} уже есть.')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        # Как у роутера: параметры @action (пагинация по ключу).
+        self.view = RecipeViewSet.as_view({'get': 'feed'},
+                                          **RecipeViewSet.feed.kwargs)
+        self.factory = APIRequestFactory()
+        with transaction.atomic(), override_settings(
+                ALLOWED_HOSTS=['testserver']):
+            authors = self.create_authors()
+            self.stdout.write(f'Авторов: {len(authors)}, рецептов: '
+                              f'{len(authors) * options["recipes"]}')
+            viewer = User.objects.create(
+                username=f'{PREFIX}viewer', email='viewer@benchmark.local')
+            for count in follows:
+                Subscribe.objects.filter(user=viewer).delete()
+                Subscribe.objects.bulk_create(
+                    [Subscribe(user=viewer, author_id=author_id)
+                     for author_id in self.rng.sample(authors, count)],
+                    batch_size=options['batch_size'])
+                first = self.measure(viewer, None)
+                cursor = self.find_cursor(viewer)
+                deep = self.measure(viewer, cursor)
+                self.stdout.write(
+                    f'подписок {count:6d}: первая страница {first:6.1f} мс, '
+                    f'страница {options["page"]} {deep:6.1f} мс')
+            transaction.set_rollback(True)
+
+    def create_authors(self):
+        options = self.options
+        users = [User(username=f'{PREFIX}{number}',
+                      email=f'{PREFIX}{number}@benchmark.local')
+                 for number in range(options['authors'])]
+        User.objects.bulk_create(users, batch_size=options['batch_size'])
+        authors = list(User.objects.filter(
+            username__startswith=PREFIX).values_list('pk', flat=True))
+        recipes = []
+        for author_id in authors:
+            for _ in range(options['recipes']):
+                pub_date = EPOCH - PUBLISH_PERIOD * self.rng.random()
+                recipes.append(Recipe(
+                    author_id=author_id, name='Рецепт', text='Текст',
+                    cooking_time=1, image='recipes_img/benchmark.jpg',
+                    pub_date=pub_date, updated=pub_date))
+        with explicit_dates(Recipe, 'pub_date', 'updated'):
+            Recipe.objects.bulk_create(recipes,
+                                       batch_size=options['batch_size'])
+        # Статистика для планировщика, как после autovacuum в работе.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return authors
+
+    def get(self, viewer, cursor):
+        params = {'limit': self.options['limit']}
+        if cursor is not None:
+            params['cursor'] = cursor
+        request = self.factory.get(FEED_URL, params)
+        force_authenticate(request, user=viewer)
+        response = self.view(request)
+        response.render()
+        if response.status_code != 200:
+            raise CommandError(f'{FEED_URL}: {response.status_code}')
+        return response
+
+    def find_cursor(self, viewer):
+        """Курсор страницы --page: переход по ссылкам next."""
+        cursor = None
+        for _ in range(self.options['page'] - 1):
+            link = self.get(viewer, cursor).data['next']
+            if link is None:
+                raise CommandError(f'В ленте меньше {self.options["page"]} '
+                                   f'страниц.')
+            cursor = parse_qs(urlparse(link).query)['cursor'][0]
+        return cursor
+
+    def measure(self, viewer, cursor):
+        started = time.perf_counter()
+        for _ in range(self.options['requests']):
+            self.get(viewer, cursor)
+        return (time.perf_counter() - started) / self.options[
+            'requests'] * 1000
@@ -1,35 +1,129 @@
+import csv
 import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from foodgram.settings import BASE_DIR
 from recipes.models import Ingredient, Tag
+from recipes.versions import bump_catalog_version
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """
+    Потоковое чтение JSON-массива объектов: файл читается кусками,
+    в памяти - только текущий кусок и разбираемый объект.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('Ожидается JSON-массив объектов.')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if started and buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Файл JSON оборван или повреждён.')
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_csv_rows(file):
+    """Строки CSV без заголовка: наименование, единица измерения."""
+    for row in csv.reader(file):
+        if row:
+            yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+def iter_ingredients(file, file_format):
+    rows = (iter_json_array(file) if file_format == 'json'
+            else iter_csv_rows(file))
+    for row in rows:
+        yield Ingredient(name=row['name'].strip(),
+                         measurement_unit=row['measurement_unit'].strip())
 
 
 class Command(BaseCommand):
-    """Команда импорта данных из файла *json в базу данных sqlite"""
+    """
+    Импорт ингредиентов (JSON или CSV) и тегов в базу данных.
+    Файл читается потоком и пишется пачками bulk_create в одной
+    транзакции; уже существующие ингредиенты (name + measurement_unit)
+    и теги (slug) пропускаются, поэтому команду можно запускать
+    повторно.
+    """
 
     help = "Импорт данных"
 
-    def handle(self, *args, **kwargs):
-        json_file_path = f'{BASE_DIR}/data/ingredients.json'
-        with open(json_file_path, 'r', encoding='utf-8') as json_file:
-            data = json.load(json_file)
-            for item in data:
-                obj = Ingredient(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit'],
-                )
-                obj.save()
-
-        json_file_path = f'{BASE_DIR}/data/tags.json'
-        with open(json_file_path, 'r', encoding='utf-8') as json_file:
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=f'{BASE_DIR}/data/ingredients.json',
+            help='Файл ингредиентов: .json или .csv')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = os.path.splitext(path)[1].lower().lstrip('.')
+        if file_format not in ('json', 'csv'):
+            raise CommandError('Поддерживаются файлы .json и .csv.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            before = Ingredient.objects.count()
+            total = self.import_ingredients(path, file_format,
+                                            options['batch_size'])
+            created = Ingredient.objects.count() - before
+            tags = self.import_tags(f'{BASE_DIR}/data/tags.json')
+        elapsed = time.monotonic() - started
+        bump_catalog_version()
+        self.stdout.write(
+            f'Ингредиентов прочитано: {total}, добавлено: {created}, '
+            f'тегов добавлено: {tags}; {elapsed:.2f} с, '
+            f'{total / max(elapsed, 1e-6):.0f} строк/с')
+        self.stdout.write('База данных заполнена')
+
+    def import_ingredients(self, path, file_format, batch_size):
+        total = 0
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            ingredients = iter_ingredients(file, file_format)
+            while True:
+                batch = list(islice(ingredients, batch_size))
+                if not batch:
+                    return total
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+
+    def import_tags(self, path):
+        """Тегов единицы, а бит в маске назначает Tag.save()."""
+        with open(path, 'r', encoding='utf-8') as json_file:
             data = json.load(json_file)
-            for item in data:
-                obj = Tag(
-                    name=item['name'],
-                    color=item['color'],
-                    slug=item['slug'],
-                )
-                obj.save()
-        print('База данных заполнена')
+        existing = set(Tag.objects.values_list('slug', flat=True))
+        created = 0
+        for item in data:
+            if item['slug'] in existing:
+                continue
+            Tag(name=item['name'], color=item['color'],
+                slug=item['slug']).save()
+            created += 1
+        return created
@@ -0,0 +1,309 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.versions import bump_recipes_version
+from users.models import Subscribe, User
+
+# Все даты отсчитываются от фиксированного момента: при одном seed
+# набор данных совпадает между запусками.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PUBLISH_PERIOD = timedelta(days=3 * 365)
+PASSWORD = 'loadtest-password'
+IMAGE_SIZE = (640, 480)
+
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Елена', 'Олег', 'Ольга',
+               'Сергей', 'Наталья', 'Дмитрий', 'Ирина', 'Алексей')
+LAST_NAMES = ('Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова',
+              'Соколов', 'Лебедева', 'Козлов', 'Новикова', 'Морозов')
+DISHES = ('Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Каша', 'Омлет',
+          'Паста', 'Плов', 'Котлеты', 'Блины', 'Соус', 'Десерт')
+STYLES = ('домашний', 'быстрый', 'праздничный', 'летний', 'острый',
+          'постный', 'бабушкин', 'сытный')
+STEPS = ('Подготовьте продукты.', 'Нарежьте овощи.', 'Разогрейте духовку.',
+         'Смешайте ингредиенты.', 'Доведите до кипения.',
+         'Готовьте на медленном огне.', 'Посолите и поперчите по вкусу.',
+         'Дайте настояться.', 'Подавайте горячим.', 'Украсьте зеленью.')
+
+
+def zipf_cum_weights(size, skew):
+    """Накопленные веса рангов 1..size: вес ранга i - 1 / i ** skew."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def weighted_sample(rng, population, cum_weights, k):
+    """k различных элементов population с учётом весов."""
+    k = min(k, len(population))
+    chosen = set()
+    while len(chosen) < k:
+        chosen.update(rng.choices(population, cum_weights=cum_weights,
+                                  k=k - len(chosen)))
+    return chosen
+
+
+def skewed_count(rng, mean, limit):
+    """Количество с экспоненциальным распределением: у немногих - много."""
+    if mean <= 0:
+        return 0
+    return min(int(rng.expovariate(1 / mean)), limit)
+
+
+@contextmanager
+def explicit_dates(model, *field_names):
+    """
+    Отключает auto_now/auto_now_add на время bulk_create, чтобы
+    сохранить сгенерированные даты публикации.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетического набора данных для нагрузочных тестов:
+    пользователи, рецепты с тегами и ингредиентами, избранное,
+    списки покупок и подписки. Популярность авторов, рецептов,
+    тегов и ингредиентов распределена по закону Ципфа (--skew),
+    активность пользователей - экспоненциально. Всё пишется
+    пачками bulk_create в одной транзакции, денормализованные
+    счётчики и итоги корзин пересчитываются в конце
+    (recount_counters). Результат детерминирован при заданном --seed.
+    Теги и ингредиенты берутся из базы (db_import_data).
+    """
+
+    help = "Генерация синтетического набора данных"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число избранных рецептов у пользователя')
+        parser.add_argument(
+            '--cart', type=float, default=3,
+            help='Среднее число рецептов в списке покупок')
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='Среднее число подписок у пользователя')
+        parser.add_argument(
+            '--ingredients', type=int, default=7,
+            help='Среднее число ингредиентов в рецепте')
+        parser.add_argument(
+            '--skew', type=float, default=1.0,
+            help='Показатель распределения Ципфа для популярности')
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Количество разных изображений-заглушек')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс имён пользователей (для повторной генерации)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['recipes'], options['images'],
+               options['batch_size']) < 1:
+            raise CommandError('--users, --recipes, --images и --batch-size '
+                               'должны быть больше нуля.')
+        tags = list(Tag.objects.order_by('id'))
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if not tags or not ingredient_ids:
+            raise CommandError('Нет тегов или ингредиентов: сначала '
+                               'выполните db_import_data.')
+        if User.objects.filter(
+                username__startswith=f'{options["prefix"]}_').exists():
+            raise CommandError(f'Пользователи с префиксом '
+                               f'{options["prefix"]} уже есть, '
+                               f'задайте другой --prefix.')
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        # Ранги популярности - случайная перестановка, чтобы
+        # популярными были не первые по id записи.
+        self.rng.shuffle(tags)
+        self.rng.shuffle(ingredient_ids)
+        started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.timed('Пользователи', self.create_users)
+            images = self.timed('Изображения', self.create_images)
+            recipe_ids = self.timed(
+                'Рецепты', self.create_recipes, user_ids, tags,
+                ingredient_ids, images)
+            self.timed('Избранное', self.create_pairs, Favorite, 'user',
+                       user_ids, recipe_ids, options['favorites'])
+            self.timed('Списки покупок', self.create_pairs, ShoppingCart,
+                       'author', user_ids, recipe_ids, options['cart'])
+            self.timed('Подписки', self.create_subscriptions, user_ids)
+            call_command('recount_counters', stdout=self.stdout)
+            bump_recipes_version()
+        self.stdout.write(f'Готово за {time.monotonic() - started:.1f} с')
+
+    def timed(self, title, method, *args):
+        started = time.monotonic()
+        result, rows = method(*args)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'{title}: {rows} строк, {elapsed:.1f} с, '
+                          f'{rows / elapsed:.0f} строк/с')
+        return result
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        return len(objects)
+
+    def new_ids(self, model, after, count):
+        """id только что вставленных строк: bulk_create в SQLite их
+        не возвращает, а id выдаются по возрастанию."""
+        return list(model.objects.filter(pk__gt=after).order_by(
+            'pk').values_list('pk', flat=True)[:count])
+
+    def last_id(self, model):
+        return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    def create_users(self):
+        rng, prefix = self.rng, self.options['prefix']
+        password = make_password(
+            PASSWORD, salt=f'{prefix}{self.options["seed"]}')
+        after = self.last_id(User)
+        users = [
+            User(username=f'{prefix}_{number}',
+                 email=f'{prefix}_{number}@example.com',
+                 first_name=rng.choice(FIRST_NAMES),
+                 last_name=rng.choice(LAST_NAMES),
+                 password=password,
+                 date_joined=EPOCH - PUBLISH_PERIOD)
+            for number in range(self.options['users'])
+        ]
+        rows = self.bulk_create(User, users)
+        return self.new_ids(User, after, rows), rows
+
+    def create_images(self):
+        """Заглушки разных цветов; хранилище называет их по хэшу."""
+        field = Recipe._meta.get_field('image')
+        names = []
+        for _ in range(self.options['images']):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+            names.append(field.storage.save(
+                f'{field.upload_to}placeholder.jpg',
+                ContentFile(buffer.getvalue())))
+        return names, len(names)
+
+    def create_recipes(self, user_ids, tags, ingredient_ids, images):
+        rng, options = self.rng, self.options
+        author_weights = zipf_cum_weights(len(user_ids), options['skew'])
+        tag_weights = zipf_cum_weights(len(tags), options['skew'])
+        ingredient_weights = zipf_cum_weights(len(ingredient_ids),
+                                              options['skew'])
+        names = dict(Ingredient.objects.values_list('id', 'name'))
+        recipe_ids = []
+        rows = 0
+        total = options['recipes']
+        with explicit_dates(Recipe, 'pub_date', 'updated'):
+            for start in range(0, total, self.batch_size):
+                recipes, links = [], []
+                for _ in range(min(self.batch_size, total - start)):
+                    recipe_tags = weighted_sample(
+                        rng, tags, tag_weights,
+                        rng.choices((1, 2, 3), weights=(6, 3, 1))[0])
+                    recipe_ingredients = weighted_sample(
+                        rng, ingredient_ids, ingredient_weights,
+                        max(1, skewed_count(rng, options['ingredients'],
+                                            len(ingredient_ids))))
+                    main = names[next(iter(recipe_ingredients))]
+                    pub_date = EPOCH - PUBLISH_PERIOD * rng.random()
+                    recipes.append(Recipe(
+                        name=f'{rng.choice(DISHES)} {rng.choice(STYLES)}: '
+                             f'{main}',
+                        text=' '.join(rng.sample(STEPS, rng.randint(3, 7))),
+                        cooking_time=rng.randint(5, 180),
+                        author_id=rng.choices(
+                            user_ids, cum_weights=author_weights)[0],
+                        image=rng.choice(images),
+                        tags_mask=Tag.get_mask(recipe_tags),
+                        pub_date=pub_date,
+                        updated=pub_date,
+                    ))
+                    links.append((sorted(tag.id for tag in recipe_tags),
+                                  sorted(recipe_ingredients)))
+                after = self.last_id(Recipe)
+                rows += self.bulk_create(Recipe, recipes)
+                ids = self.new_ids(Recipe, after, len(recipes))
+                recipe_ids.extend(ids)
+                rows += self.create_links(ids, links)
+        return recipe_ids, rows
+
+    def create_links(self, ids, links):
+        rng = self.rng
+        recipe_tags = [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id, (tag_ids, _) in zip(ids, links)
+            for tag_id in tag_ids
+        ]
+        ingredients = [
+            IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=rng.randint(1, 500))
+            for recipe_id, (_, ingredient_ids) in zip(ids, links)
+            for ingredient_id in ingredient_ids
+        ]
+        return (self.bulk_create(Recipe.tags.through, recipe_tags)
+                + self.bulk_create(IngredientRecipe, ingredients))
+
+    def create_pairs(self, model, user_field, user_ids, recipe_ids, mean):
+        """Избранное или список покупок: популярные рецепты - чаще."""
+        rng = self.rng
+        recipe_weights = zipf_cum_weights(len(recipe_ids),
+                                          self.options['skew'])
+        rows = 0
+        batch = []
+        for user_id in user_ids:
+            count = skewed_count(rng, mean, len(recipe_ids))
+            for recipe_id in sorted(weighted_sample(
+                    rng, recipe_ids, recipe_weights, count)):
+                batch.append(model(**{f'{user_field}_id': user_id,
+                                      'recipe_id': recipe_id}))
+            if len(batch) >= self.batch_size:
+                rows += self.bulk_create(model, batch)
+                batch = []
+        rows += self.bulk_create(model, batch)
+        return None, rows
+
+    def create_subscriptions(self, user_ids):
+        """Подписки на авторов - с тем же распределением популярности."""
+        rng = self.rng
+        author_weights = zipf_cum_weights(len(user_ids), self.options['skew'])
+        rows = 0
+        batch = []
+        for user_id in user_ids:
+            count = skewed_count(rng, self.options['subscriptions'],
+                                 len(user_ids) - 1)
+            authors = weighted_sample(rng, user_ids, author_weights, count)
+            authors.discard(user_id)
+            batch.extend(Subscribe(user_id=user_id, author_id=author_id)
+                         for author_id in sorted(authors))
+            if len(batch) >= self.batch_size:
+                rows += self.bulk_create(Subscribe, batch)
+                batch = []
+        rows += self.bulk_create(Subscribe, batch)
+        return None, rows
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import (VARIANTS_DIR, make_variants, schedule_variants,
+                            variants_ready)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Построение вариантов (миниатюры, WebP) для уже загруженных
+    изображений recipes_img/ пулом процессов.
+    """
+
+    help = "Построение вариантов изображений рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить и уже существующие варианты (те же '
+                 'параметры - то же имя файла)')
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to
+        files = []
+        if default_storage.exists(directory):
+            _, files = default_storage.listdir(directory)
+        names = [os.path.join(directory, name) for name in sorted(files)
+                 if not name.startswith('.')]
+        self.stdout.write(f'Изображений: {len(names)}, '
+                          f'процессов: {settings.IMAGE_WORKERS or 1}')
+        created = failed = 0
+        if not settings.IMAGE_WORKERS:
+            for name in names:
+                try:
+                    variants = make_variants(name, options['force'])
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                if variants:
+                    variants_ready(name)
+                created += len(variants)
+        else:
+            futures = {}
+            for name in names:
+                future = schedule_variants(name, options['force'])
+                if future is None:
+                    failed += 1
+                    self.stderr.write(f'{name}: задача не поставлена '
+                                      f'в очередь')
+                    continue
+                futures[future] = name
+            for future in as_completed(futures):
+                try:
+                    created += len(future.result())
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+        self.stdout.write(f'Создано вариантов: {created}, ошибок: {failed} '
+                          f'({VARIANTS_DIR}/ в {directory})')
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from recipes.cart import rebuild_cart_totals
+from recipes.models import Favorite, Recipe
+from users.models import Subscribe, User
+
+
+def count_of(model, field):
+    """Подзапрос: количество строк model, ссылающихся на текущий объект."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт денормализованных счётчиков и итогов списков покупок
+    по исходным таблицам.
+    """
+
+    help = ("Пересчёт счётчиков избранного, рецептов, подписчиков "
+            "и итогов списков покупок")
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            for model, counter, source, field in COUNTERS:
+                drift = model.objects.alias(
+                    actual=count_of(source, field)
+                ).exclude(**{counter: F('actual')}).count()
+                model.objects.update(**{counter: count_of(source, field)})
+                self.stdout.write(
+                    f'{model.__name__}.{counter}: исправлено {drift}')
+            rebuild_cart_totals()
+            self.stdout.write('ShoppingCartTotal: пересчитано')
@@ -0,0 +1,85 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ORDERINGS = {
+    'total': lambda stat: stat['total'],
+    'count': lambda stat: stat['count'],
+    'max': lambda stat: stat['max'],
+}
+
+
+def read_entries(path, backups):
+    """Строки журнала, начиная с самых старых файлов ротации."""
+    paths = [f'{path}.{number}' for number in range(backups, 0, -1)]
+    for name in paths + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class Command(BaseCommand):
+    """
+    Сводка журнала медленных запросов (foodgram.slow_queries):
+    запросы сгруппированы по нормализованному SQL и отсортированы
+    по суммарному времени, количеству или максимуму.
+    """
+
+    help = "Сводка медленных запросов к БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=settings.SLOW_QUERY_LOG_FILE,
+            help='Журнал; файлы ротации (.1, .2, ...) читаются тоже')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument(
+            '--order-by', choices=sorted(ORDERINGS), default='total')
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Вывести последний план выполнения каждого запроса')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not any(os.path.exists(name) for name in (path, f'{path}.1')):
+            raise CommandError(f'Журнал {path} не найден.')
+        stats = {}
+        for entry in read_entries(path, settings.SLOW_QUERY_LOG_BACKUP_COUNT):
+            stat = stats.setdefault(entry['fingerprint'], {
+                'sql': entry['sql'], 'count': 0, 'total': 0.0, 'max': 0.0,
+                'routes': set(), 'fields': set(), 'plan': None,
+            })
+            duration = entry['duration_ms']
+            stat['count'] += 1
+            stat['total'] += duration
+            stat['max'] = max(stat['max'], duration)
+            stat['routes'].add(entry.get('route') or '-')
+            if entry.get('field'):
+                stat['fields'].add(entry['field'])
+            if entry.get('plan'):
+                stat['plan'] = entry['plan']
+        top = sorted(stats.items(), key=lambda item: ORDERINGS[
+            options['order_by']](item[1]), reverse=True)[:options['top']]
+        total = sum(stat['count'] for stat in stats.values())
+        self.stdout.write(f'Запросов: {total}, различных: {len(stats)}')
+        for number, (key, stat) in enumerate(top, 1):
+            self.stdout.write(
+                f'\n{number}. [{key}] всего {stat["total"]:.0f} мс, '
+                f'{stat["count"]} раз, среднее '
+                f'{stat["total"] / stat["count"]:.1f} мс, '
+                f'максимум {stat["max"]:.1f} мс')
+            self.stdout.write(
+                f'   маршруты: {", ".join(sorted(stat["routes"]))}')
+            if stat['fields']:
+                self.stdout.write(
+                    f'   поля: {", ".join(sorted(stat["fields"]))}')
+            self.stdout.write(f'   {stat["sql"]}')
+            if options['plans'] and stat['plan']:
+                for line in stat['plan'].splitlines():
+                    self.stdout.write(f'     {line}')
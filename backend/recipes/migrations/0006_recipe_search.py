@@ -0,0 +1,26 @@
+# Generated by Django 3.2.3 on 2026-10-17 05:56
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.search import install_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_tag_bit_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(install, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    rows = ShoppingCart.objects.values_list(
+        'author', 'recipe__ingredient_recipe__ingredient'
+    ).annotate(total=Sum('recipe__ingredient_recipe__amount')).filter(
+        total__isnull=False).order_by()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=user, ingredient_id=ingredient,
+                          amount=total)
+        for user, ingredient, total in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='Уникальная пара для итогов списка покупок'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-17 06:15
+
+from django.db import migrations, models
+import foodgram.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shopping_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Добавьте изображение готового блюда', storage=foodgram.storage.ContentHashStorage(), upload_to='recipes_img/', verbose_name='Изображение блюда'),
+        ),
+    ]
@@ -1,10 +1,14 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from foodgram.constants import (NAME_LEN, SLUG_LEN, SYM_NUM, MEASURE_UNIT,
                                 COLOR_LEN, MIN_COOK_TIME, MAX_COOK_TIME,
-                                MIN_AMOUNT, MAX_AMOUNT)
+                                MIN_AMOUNT, MAX_AMOUNT, MAX_TAGS)
+from foodgram.mixins import MaintainedFieldsMixin
+from foodgram.storage import content_hash_storage
 from users.models import User
 
 
@@ -30,6 +34,11 @@ class Tag(models.Model):
         unique=True,
         help_text='Укажите слаг',
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске тегов рецепта',
+        unique=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -39,6 +48,33 @@ class Tag(models.Model):
     def __str__(self):
         return self.slug
 
+    @property
+    def mask(self):
+        return 1 << self.bit
+
+    @staticmethod
+    def get_mask(tags):
+        """Маска набора тегов для Recipe.tags_mask."""
+        mask = 0
+        for tag in tags:
+            mask |= tag.mask
+        return mask
+
+    def clean(self):
+        if self.bit is None and Tag.objects.count() >= MAX_TAGS:
+            raise ValidationError(
+                f'Нельзя создать больше {MAX_TAGS} тегов.')
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            used = set(Tag.objects.values_list('bit', flat=True))
+            free = [bit for bit in range(MAX_TAGS) if bit not in used]
+            if not free:
+                raise ValidationError(
+                    f'Нельзя создать больше {MAX_TAGS} тегов.')
+            self.bit = free[0]
+        super().save(*args, **kwargs)
+
 
 class Ingredient(models.Model):
     """
@@ -70,7 +106,7 @@ class Ingredient(models.Model):
         return self.name[:SYM_NUM]
 
 
-class Recipe(models.Model):
+class Recipe(MaintainedFieldsMixin, models.Model):
     """
     Модель рецепта блюда.
     """
@@ -83,6 +119,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение блюда',
         upload_to='recipes_img/',
+        storage=content_hash_storage,
         help_text='Добавьте изображение готового блюда',
     )
     text = models.TextField(
@@ -121,19 +158,54 @@ class Recipe(models.Model):
         verbose_name='Тег',
         help_text='Выберите Тег',
     )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+        ]
+
+    maintained_fields = ('tags_mask', 'search_vector', 'favorites_count')
 
     def __str__(self):
         return self.name[:SYM_NUM]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминает имя файла изображения, прочитанное из БД."""
+        instance = super().from_db(db, field_names, values)
+        if 'image' in instance.__dict__:
+            instance.stored_image = instance.__dict__['image']
+        return instance
+
 
 class IngredientRecipe(models.Model):
     """
@@ -247,3 +319,63 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.author}'
+
+
+class ShoppingCartTotal(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Поддерживается при добавлении и удалении рецептов из списка
+    и при изменении ингредиентов рецептов (recipes.cart).
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='Уникальная пара для итогов списка покупок',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount} у {self.user}'
+
+
+class Version(models.Model):
+    """
+    Счётчик версии данных (справочники, рецепты), общий для всех
+    процессов: по нему процессы сбрасывают кэши в памяти, а клиенты
+    получают новый ETag. См. recipes.versions.
+    """
+    name = models.CharField(
+        verbose_name='Имя',
+        max_length=SLUG_LEN,
+        primary_key=True,
+    )
+    value = models.BigIntegerField(
+        verbose_name='Версия',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,129 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+NAME_WEIGHT, TEXT_WEIGHT = 10.0, 1.0
+
+POSTGRES_SQL = (
+    f"""
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe;',
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+    """,
+    'UPDATE recipes_recipe SET name = name WHERE search_vector IS NULL;',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector);',
+)
+
+SQLITE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    """,
+)
+
+
+def install_search_index(schema_editor=None, using=DEFAULT_DB_ALIAS,
+                         **kwargs):
+    """
+    Создаёт полнотекстовый индекс рецептов:
+    - PostgreSQL: колонка search_vector, триггер для её обновления и GIN.
+    - SQLite (TEST_DATABASE): таблица FTS5 с триггерами.
+    SQLite пересоздаёт таблицу при изменении её схемы и теряет триггеры,
+    поэтому функция вызывается и после каждой миграции (post_migrate).
+    """
+    db = schema_editor.connection if schema_editor else connections[using]
+    if 'recipes_recipe' not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        if db.vendor == 'postgresql':
+            for sql in POSTGRES_SQL:
+                cursor.execute(sql)
+        elif db.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+                "AND name LIKE 'recipes_recipe_fts_%%'"
+            )
+            if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts "
+                "USING fts5(name, text, content='recipes_recipe', "
+                "content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            for sql in SQLITE_TRIGGERS:
+                cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) "
+                "VALUES ('rebuild')"
+            )
+
+
+def search_recipes(queryset, text):
+    """
+    Фильтрует рецепты по поисковой строке и сортирует по релевантности
+    (совпадение в названии весит больше, чем в описании).
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query))
+    elif connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        queryset = queryset.filter(pk__in=RawSQL(
+            'SELECT rowid FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s', (match,)
+        )).annotate(search_rank=RawSQL(
+            'SELECT -bm25(recipes_recipe_fts, %s, %s) '
+            'FROM recipes_recipe_fts WHERE recipes_recipe_fts MATCH %s '
+            'AND recipes_recipe_fts.rowid = recipes_recipe.id',
+            (NAME_WEIGHT, TEXT_WEIGHT, match)
+        ))
+    else:
+        for word in words:
+            queryset = queryset.filter(Q(name__icontains=word)
+                                       | Q(text__icontains=word))
+        return queryset
+    return queryset.order_by('-search_rank', '-pub_date')
@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cart import cart_users, change_cart_totals, recipe_amounts
+from .images import schedule_variants
+from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, Tag)
+from .versions import bump_catalog_version, bump_recipes_version
+from users.models import User
+from users.signals import change_counter
+
+AUTHOR_PROFILE_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+_bulk_changes = ContextVar('bulk_changes', default=False)
+
+
+@contextmanager
+def bulk_changes():
+    """
+    Массовое удаление связей через QuerySet.delete(): вызывающий код
+    сам обновляет счётчики, итоги списков покупок и дату изменения
+    рецепта одной операцией, поэтому обработчики post_delete связей
+    внутри блока ничего не делают.
+    """
+    token = _bulk_changes.set(True)
+    try:
+        yield
+    finally:
+        _bulk_changes.reset(token)
+
+
+def touch_recipes(**filters):
+    """Обновляет дату изменения рецептов - версию их кэша."""
+    Recipe.objects.filter(**filters).update(updated=timezone.now())
+    bump_recipes_version()
+
+
+def with_tag(tag):
+    return Recipe.objects.alias(
+        has_tag=F('tags_mask').bitand(tag.mask)
+    ).filter(has_tag__gt=0)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_recipes(pk=instance.pk)
+    elif pk_set:
+        touch_recipes(pk__in=pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддерживает Recipe.tags_mask в соответствии со связями рецепта и тегов
+    (serializer, админка) и обновляет дату изменения рецептов.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    bump_recipes_version()
+    now = timezone.now()
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).update(
+            tags_mask=Tag.get_mask(instance.tags.only('bit')),
+            updated=now)
+        return
+    if action == 'post_add':
+        Recipe.objects.filter(pk__in=pk_set).update(
+            tags_mask=F('tags_mask').bitor(instance.mask), updated=now)
+        return
+    recipes = with_tag(instance)
+    if action == 'post_remove':
+        recipes = recipes.filter(pk__in=pk_set)
+    recipes.update(tags_mask=F('tags_mask').bitand(~instance.mask),
+                   updated=now)
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_recipe_changed(sender, instance, **kwargs):
+    if _bulk_changes.get():
+        return
+    touch_recipes(pk=instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def ingredient_recipe_saving(sender, instance, **kwargs):
+    """Запоминает прежний ингредиент и количество для итогов корзин."""
+    instance.previous_amount = instance.pk and IngredientRecipe.objects.filter(
+        pk=instance.pk).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_recipe_saved(sender, instance, **kwargs):
+    amounts = [(instance.ingredient_id, instance.amount)]
+    previous = getattr(instance, 'previous_amount', None)
+    if previous:
+        amounts.append((previous[0], -previous[1]))
+    change_cart_totals(cart_users(instance.recipe_id), amounts)
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_recipe_deleted(sender, instance, **kwargs):
+    if _bulk_changes.get():
+        return
+    change_cart_totals(cart_users(instance.recipe_id),
+                       [(instance.ingredient_id, instance.amount)], -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(sender, instance, created, **kwargs):
+    if created:
+        change_cart_totals([instance.author_id],
+                           recipe_amounts(instance.recipe_id))
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    if _bulk_changes.get():
+        return
+    change_cart_totals([instance.author_id],
+                       recipe_amounts(instance.recipe_id), -1)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields
+                   and not AUTHOR_PROFILE_FIELDS.intersection(update_fields)):
+        return
+    touch_recipes(author=instance)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    bump_recipes_version()
+    with_tag(instance).update(
+        tags_mask=F('tags_mask').bitand(~instance.mask),
+        updated=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                       'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    if _bulk_changes.get():
+        return
+    change_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                   'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, **kwargs):
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, created, update_fields, **kwargs):
+    """
+    Варианты изображения строятся пулом после фиксации транзакции -
+    только для нового рецепта или если имя файла изменилось: save()
+    существующего рецепта всегда передаёт image в update_fields.
+    """
+    if update_fields and 'image' not in update_fields:
+        return
+    name = instance.image.name or ''
+    changed = created or name != getattr(instance, 'stored_image', None)
+    instance.stored_image = name
+    if name and changed:
+        transaction.on_commit(partial(schedule_variants, name))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'recipes_count', -1)
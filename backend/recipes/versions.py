@@ -0,0 +1,63 @@
+from collections import Counter
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Version
+
+CATALOG_VERSION = 'catalog'
+RECIPES_VERSION = 'recipes'
+
+# Увеличения версий, сделанные этим процессом: по ним кэши процесса
+# узнают о своих изменениях без чтения Version.
+local_bumps = Counter()
+
+
+def get_version(name):
+    """Текущая версия; одна выборка по первичному ключу."""
+    return Version.objects.filter(name=name).values_list(
+        'value', flat=True).first() or 0
+
+
+def _bump_version(name):
+    if not Version.objects.filter(name=name).update(value=F('value') + 1):
+        Version.objects.get_or_create(name=name)
+        Version.objects.filter(name=name).update(value=F('value') + 1)
+    local_bumps[name] += 1
+
+
+def bump_version(name):
+    """
+    Увеличивает версию после фиксации текущей транзакции: строка
+    счётчика блокируется только на время одного UPDATE, а новая
+    версия не становится видна раньше изменённых данных.
+    Повторные вызовы в одной транзакции дают одно увеличение.
+    """
+    for _, pending in connection.run_on_commit:
+        if getattr(pending, 'func', None) is _bump_version \
+                and pending.args == (name,):
+            return
+    transaction.on_commit(partial(_bump_version, name))
+
+
+def get_catalog_version():
+    """
+    Версия справочников (теги, ингредиенты). Хранится в БД, поэтому
+    изменения из любого процесса (админка, db_import_data) видны всем.
+    """
+    return get_version(CATALOG_VERSION)
+
+
+def bump_catalog_version():
+    """Сбрасывает всё, что закэшировано с текущей версией справочников."""
+    bump_version(CATALOG_VERSION)
+
+
+def get_recipes_version():
+    """Версия рецептов: меняется при любом изменении рецепта."""
+    return get_version(RECIPES_VERSION)
+
+
+def bump_recipes_version():
+    bump_version(RECIPES_VERSION)
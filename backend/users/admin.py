@@ -9,7 +9,7 @@ class UserAdmin(UAdmin):
     Админ-зона пользователей.
     """
     list_display = ('id', 'username', 'email', 'first_name', 'last_name',
-                    'password')
+                    'password', 'recipes_count', 'followers_count')
     list_filter = ('username', 'email',)
     empty_value_display = '-пусто-'
 
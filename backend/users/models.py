@@ -4,9 +4,10 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 
 from foodgram.constants import (USERNAME_LEN, FIRST_NAME_LEN,
                                 LAST_NAME_LEN, PASS_LEN)
+from foodgram.mixins import MaintainedFieldsMixin
 
 
-class User(AbstractUser):
+class User(MaintainedFieldsMixin, AbstractUser):
     """
     Custom-Модель User'a.
     """
@@ -43,6 +44,18 @@ class User(AbstractUser):
         max_length=PASS_LEN,
         help_text="Придумайте пароль",
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    maintained_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscribe, User
+
+_locked_users = ContextVar('locked_users', default=frozenset())
+
+
+def change_counter(queryset, field, delta):
+    """Изменяет счётчик одним UPDATE, не опуская его ниже нуля."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+@contextmanager
+def lock_users(users):
+    """
+    Транзакция с блокировкой строк пользователей (по порядку pk).
+    Все изменения избранного и списков покупок пользователя идут под
+    этой блокировкой, поэтому прочитанные под ней связи не меняются
+    параллельными запросами, а счётчики и итоги не изменяются дважды
+    при одновременном удалении одной связи. Это сознательное
+    отступление от «одна операция - один запрос» и для одиночного
+    добавления/удаления: блокировка - один SELECT ... FOR UPDATE по
+    первичному ключу. Строки, уже заблокированные во внешнем блоке
+    (например, итоги списка покупок внутри добавления рецепта в
+    список), повторно не блокируются.
+    """
+    locked = _locked_users.get()
+    users = set(users)
+    with transaction.atomic():
+        if not users <= locked:
+            list(User.objects.select_for_update().filter(
+                pk__in=users - locked).order_by('pk').values_list('pk'))
+        token = _locked_users.set(locked | users)
+        try:
+            yield
+        finally:
+            _locked_users.reset(token)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'followers_count', -1)